@@ -0,0 +1,218 @@
+"""Synthesize a manifest of texts with ElevenLabs or Clova.
+
+    python batch_synthesize.py prompts.jsonl out/ --provider elevenlabs --workers 4 --rate 2
+    python batch_synthesize.py prompts.csv out/ --provider clova
+
+The manifest is JSONL (one object per line with a "text" field and an
+optional "id") or CSV with a "text" column. Identical texts (after whitespace
+and Unicode normalization) are synthesized once. Output files are named by
+the TTS cache key, so the same text, voice and settings always land in the
+same file. Finished items are appended to <out>/journal.jsonl and skipped
+when the run is restarted; <out>/index.jsonl maps every manifest row to its
+file once the run completes.
+"""
+import argparse
+import csv
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from tts_cache import normalize_text
+
+PROGRESS_EVERY = 25
+
+
+def _load(directory, filename, name):
+    sys.path.insert(0, os.path.join(ROOT, directory))
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, directory, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Provider:
+    def __init__(self, name, ext, key, synthesize, duration):
+        self.name = name
+        self.ext = ext
+        self.key = key
+        self.synthesize = synthesize        # (text, path) -> truthy on success, raises or returns None on failure
+        self.duration = duration            # path -> audio seconds
+
+
+def mp3_duration(bytes_per_second):
+    # constant-bitrate output formats, so the size gives the length
+    return lambda path: os.path.getsize(path) / bytes_per_second
+
+
+def wav_duration(path):
+    with wave.open(path, 'rb') as f:
+        return f.getnframes() / f.getframerate()
+
+
+def load_provider(name):
+    if name == "elevenlabs":
+        tts = _load("elevenlabs_tts", "tts_file.py", "elevenlabs_tts_file")
+        kbps = int(tts.OUTPUT_FORMAT.rsplit("_", 1)[-1])
+        return Provider(name, "mp3", tts.audio_key, tts.text_to_speech_file, mp3_duration(kbps * 1000 / 8))
+    if name == "clova":
+        clova = _load("clova_tts", "main.py", "clova_tts_main")
+        return Provider(name, "wav", clova.audio_key, clova.clova_tts, wav_duration)
+    raise ValueError(f"unknown provider: {name}")
+
+
+class TokenBucket:
+    """Blocks acquire() so calls never exceed `rate` per second on average, with bursts up to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def read_manifest(path):
+    rows = []
+    if path.endswith(".csv"):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for i, row in enumerate(csv.DictReader(f)):
+                rows.append({"id": row.get("id") or str(i), "text": row["text"]})
+    else:
+        with open(path, encoding='utf-8') as f:
+            for i, line in enumerate(f):
+                if line.strip():
+                    row = json.loads(line)
+                    rows.append({"id": str(row.get("id", i)), "text": row["text"]})
+    return [row for row in rows if normalize_text(row["text"])]
+
+
+class Journal:
+    """Append-only record of finished keys; a restarted run skips whatever is in it and still on disk."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue    # torn last line from an interrupted run
+                    if entry.get("status") == "ok":
+                        self.done[entry["key"]] = entry
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def record(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+            if entry["status"] == "ok":
+                self.done[entry["key"]] = entry
+
+    def close(self):
+        self._file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('manifest')
+    parser.add_argument('out_dir')
+    parser.add_argument('--provider', choices=['elevenlabs', 'clova'], default='elevenlabs')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=2.0, help='Requests per second to the provider (0: unlimited)')
+    parser.add_argument('--burst', type=int, default=2)
+    args = parser.parse_args()
+
+    provider = load_provider(args.provider)
+    os.makedirs(args.out_dir, exist_ok=True)
+    rows = read_manifest(args.manifest)
+
+    unique = {}
+    for row in rows:
+        row["key"] = provider.key(row["text"])
+        row["file"] = f"{row['key'][:32]}.{provider.ext}"
+        unique.setdefault(row["key"], row)
+
+    journal = Journal(os.path.join(args.out_dir, "journal.jsonl"))
+    pending = [row for key, row in unique.items()
+               if not (key in journal.done and os.path.exists(os.path.join(args.out_dir, row["file"])))]
+    print(f"{len(rows)} rows, {len(unique)} unique texts, {len(unique) - len(pending)} already done, "
+          f"{len(pending)} to synthesize with {args.provider}")
+
+    bucket = TokenBucket(args.rate, args.burst)
+    started = time.monotonic()
+    totals = {"ok": 0, "failed": 0, "audio_s": 0.0}
+
+    def synthesize(row):
+        path = os.path.join(args.out_dir, row["file"])
+        bucket.acquire()
+        t0 = time.monotonic()
+        if not provider.synthesize(row["text"], path):
+            raise RuntimeError("synthesis failed")
+        return {"key": row["key"], "file": row["file"], "status": "ok", "bytes": os.path.getsize(path),
+                "audio_s": round(provider.duration(path), 3), "latency_s": round(time.monotonic() - t0, 3)}
+
+    pool = ThreadPoolExecutor(max_workers=args.workers)
+    try:
+        futures = {pool.submit(synthesize, row): row for row in pending}
+        for n, future in enumerate(as_completed(futures), 1):
+            row = futures[future]
+            try:
+                entry = future.result()
+                totals["ok"] += 1
+                totals["audio_s"] += entry["audio_s"]
+            except Exception as e:
+                entry = {"key": row["key"], "file": row["file"], "status": "failed", "error": str(e)}
+                totals["failed"] += 1
+                print(f"[{row['id']}] 실패: {e}")
+            journal.record(entry)
+            if n % PROGRESS_EVERY == 0 or n == len(pending):
+                elapsed = time.monotonic() - started
+                print(f"{n}/{len(pending)}  {n / elapsed:.2f} items/s  {totals['audio_s'] / elapsed:.2f} audio-s/s")
+    except KeyboardInterrupt:
+        pool.shutdown(wait=False, cancel_futures=True)
+        print("\n중단되었습니다. 다시 실행하면 남은 항목부터 이어서 합성합니다.")
+        return 130
+    finally:
+        pool.shutdown(wait=False)
+        journal.close()
+
+    elapsed = time.monotonic() - started
+    with open(os.path.join(args.out_dir, "index.jsonl"), 'w', encoding='utf-8') as f:
+        for row in rows:
+            entry = journal.done.get(row["key"])
+            f.write(json.dumps({"id": row["id"], "text": row["text"], "file": entry["file"] if entry else None},
+                               ensure_ascii=False) + "\n")
+
+    print(f"done: {totals['ok']} synthesized, {totals['failed']} failed, "
+          f"{len(rows) - len(unique)} duplicates skipped in {elapsed:.1f}s")
+    if elapsed > 0 and pending:
+        print(f"throughput: {len(pending) / elapsed:.2f} items/s, {totals['audio_s'] / elapsed:.2f} audio-s/s")
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""Load generator: N simulated callers talking to full_pipeline/server.py at once.
+
+    python load_test.py --mock --callers 10,20,40,80 --turns 3
+    python load_test.py --url ws://10.0.0.5:8765 --callers 50 --turns 5 samples/*.wav
+
+Each caller opens a session, streams an utterance (16-bit mono 16 kHz WAV,
+or the synthetic one) paced like a microphone, keeps sending silence while
+it waits, and measures time to first audio from the end of its utterance to
+the first reply frame. Levels in --callers run one after another, so the
+report shows where p95 latency or the error rate breaks down; the last level
+within --max-ttfa-p95 and --max-error-rate is printed as the box's capacity.
+
+--mock starts mock_servers.py and server.py as separate processes, so
+neither competes with the load generator for the GIL. Without it, --url
+points at a server already running against whatever OpenAI, ElevenLabs and
+Google endpoints its environment configures.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import websockets
+
+from run_benchmark import PIPELINE_DIR, SAMPLE_RATE, percentiles, synthetic_utterance
+from audio_source import read_wav_pcm      # importable once run_benchmark has put full_pipeline on sys.path
+
+CHUNK_MS = 100
+CHUNK_BYTES = SAMPLE_RATE * 2 * CHUNK_MS // 1000
+LEAD_IN_MS = 300
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class TurnResult:
+    __slots__ = ("outcome", "ttfa_ms", "turn_ms", "audio_bytes")
+
+    def __init__(self, outcome, ttfa_ms=None, turn_ms=None, audio_bytes=0):
+        self.outcome = outcome
+        self.ttfa_ms = ttfa_ms
+        self.turn_ms = turn_ms
+        self.audio_bytes = audio_bytes
+
+
+class Caller:
+    def __init__(self, url, session_id, utterances, turns, speed=1.0, think_s=1.0, turn_timeout=30.0):
+        self.url = f"{url.rstrip('/')}/?session={session_id}"
+        self.utterances = utterances
+        self.turns = turns
+        self.interval = CHUNK_MS / 1000 / speed
+        self.think_s = think_s
+        self.turn_timeout = turn_timeout
+        self.results = []
+        self._pending = b""
+        self._speech_end = None
+        self._events = asyncio.Queue()
+
+    async def run(self, start_delay=0.0):
+        await asyncio.sleep(start_delay)
+        try:
+            async with websockets.connect(self.url, max_size=2 ** 22, open_timeout=10) as websocket:
+                sender = asyncio.ensure_future(self._send(websocket))
+                receiver = asyncio.ensure_future(self._receive(websocket))
+                try:
+                    for i in range(self.turns):
+                        self.results.append(await self._turn(self.utterances[i % len(self.utterances)]))
+                        await asyncio.sleep(self.think_s)
+                finally:
+                    sender.cancel()
+                    receiver.cancel()
+                    await asyncio.gather(sender, receiver, return_exceptions=True)
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+            # refused, "server full" or dropped mid-call: the remaining turns count as failed
+            outcome = "rejected" if not self.results else "disconnected"
+            print(f"{self.url}: {outcome} ({e})")
+            self.results.extend(TurnResult(outcome) for _ in range(self.turns - len(self.results)))
+
+    async def _send(self, websocket):
+        # a microphone never stops: silence between utterances, paced in real time
+        deadline = time.monotonic()
+        while True:
+            chunk, self._pending = self._pending[:CHUNK_BYTES], self._pending[CHUNK_BYTES:]
+            if chunk and not self._pending:
+                # a chunk covers the CHUNK_MS before it is sent; the speech stops where the padding starts
+                self._speech_end = time.monotonic() - (CHUNK_BYTES - len(chunk)) / (SAMPLE_RATE * 2)
+            await websocket.send(chunk.ljust(CHUNK_BYTES, b"\0"))
+            deadline += self.interval
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+
+    async def _receive(self, websocket):
+        async for message in websocket:
+            if isinstance(message, bytes):
+                self._events.put_nowait(("audio", len(message), time.monotonic()))
+                continue
+            event = json.loads(message)
+            if event["type"] in ("response_start", "response_end"):
+                self._events.put_nowait((event["type"], event, time.monotonic()))
+        self._events.put_nowait(("closed", None, time.monotonic()))
+
+    async def _turn(self, utterance):
+        while not self._events.empty():
+            self._events.get_nowait()
+        self._speech_end = None
+        self._pending = bytes(SAMPLE_RATE * 2 * LEAD_IN_MS // 1000) + utterance
+        first_audio = None
+        audio_bytes = 0
+        started = time.monotonic()
+        deadline = started + self.turn_timeout
+        while True:
+            try:
+                kind, payload, at = await asyncio.wait_for(self._events.get(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                return TurnResult("timeout")
+            if kind == "closed":
+                raise websockets.ConnectionClosedError(None, None)
+            if kind == "audio":
+                audio_bytes += payload
+                if first_audio is None:
+                    first_audio = at
+            elif kind == "response_end":
+                ttfa = None
+                if first_audio is not None and self._speech_end is not None:
+                    ttfa = (first_audio - self._speech_end) * 1000
+                return TurnResult(payload["outcome"], ttfa, (at - started) * 1000, audio_bytes)
+
+
+def distribution(values, unit="ms"):
+    if not values:
+        return "n/a"
+    p = percentiles(values)
+    return (f"p50 {p[50]:.0f}{unit}  p95 {p[95]:.0f}{unit}  p99 {p[99]:.0f}{unit}  "
+            f"mean {statistics.mean(values):.0f}{unit}")
+
+
+async def run_level(args, utterances, callers):
+    run_id = uuid.uuid4().hex[:6]
+    group = [Caller(args.url, f"load-{run_id}-{i}", utterances, args.turns, args.speed, args.think_s,
+                    args.turn_timeout) for i in range(callers)]
+    started = time.monotonic()
+    await asyncio.gather(*(caller.run(args.ramp_s * i / callers) for i, caller in enumerate(group)))
+    elapsed = time.monotonic() - started
+
+    results = [result for caller in group for result in caller.results]
+    ok = [result for result in results if result.outcome == "ok"]
+    failed = len(results) - len(ok)
+    ttfa = [result.ttfa_ms for result in ok if result.ttfa_ms is not None]
+    outcomes = {}
+    for result in results:
+        outcomes[result.outcome] = outcomes.get(result.outcome, 0) + 1
+    print(f"\n=== {callers} callers: {len(ok)}/{len(results)} turns ok "
+          f"({', '.join(f'{k} {v}' for k, v in sorted(outcomes.items()))}) in {elapsed:.1f}s, "
+          f"{len(ok) / elapsed * 60:.0f} turns/min")
+    print(f"time to first audio  {distribution(ttfa)}")
+    print(f"turn wall time       {distribution([result.turn_ms for result in ok])}")
+    p95 = percentiles(ttfa)[95] if ttfa else None
+    error_rate = failed / len(results) if results else 1.0
+    return p95, error_rate
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=1):
+            return
+        time.sleep(0.2)
+    raise RuntimeError(f"server did not start listening on {port}")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mock_stack(args):
+    """mock_servers.py and server.py as child processes; returns (url, processes, log directory)."""
+    workdir = tempfile.mkdtemp(prefix="pipeline-load-")
+    mocks = subprocess.Popen(
+        [sys.executable, "-u", os.path.join(HERE, "mock_servers.py"), "--first-token-ms", str(args.first_token_ms),
+         "--tts-delay-ms", str(args.tts_delay_ms)],
+        stdout=subprocess.PIPE, text=True)
+    env = dict(os.environ)
+    for _ in range(5):
+        name, _, value = mocks.stdout.readline().strip()[len("export "):].partition("=")
+        env[name] = value
+    port = free_port()
+    log = open(os.path.join(workdir, "server.log"), "w")
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.abspath(PIPELINE_DIR), "server.py"), "--host", "127.0.0.1",
+         "--port", str(port), "--max-sessions", str(max(args.levels) + 10), "--no-fallback"],
+        env=env, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+    wait_for_port(port)
+    return f"ws://127.0.0.1:{port}", [server, mocks], workdir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='WAV utterances (default: synthetic)')
+    parser.add_argument('--url', default='ws://127.0.0.1:8765', help='server.py websocket URL')
+    parser.add_argument('--mock', action='store_true', help='Start mock services and a local server.py')
+    parser.add_argument('--callers', default='10', help='Concurrent callers per level, e.g. 10,20,40')
+    parser.add_argument('--turns', type=int, default=3, help='Turns per caller')
+    parser.add_argument('--think-s', type=float, default=1.0, help='Pause between a reply and the next utterance')
+    parser.add_argument('--ramp-s', type=float, default=2.0, help='Spread caller connects over this many seconds')
+    parser.add_argument('--speed', type=float, default=1.0, help='Audio pacing; 1 is real time')
+    parser.add_argument('--turn-timeout', type=float, default=30.0)
+    parser.add_argument('--max-ttfa-p95', type=float, default=2000.0, help='Latency SLO in ms for the capacity')
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--first-token-ms', type=int, default=300, help='Mock LLM latency (--mock)')
+    parser.add_argument('--tts-delay-ms', type=int, default=250, help='Mock TTS latency (--mock)')
+    args = parser.parse_args()
+    args.levels = [int(level) for level in args.callers.split(",")]
+
+    utterances = [read_wav_pcm(path, SAMPLE_RATE) for path in args.files] or [synthetic_utterance()]
+    processes = []
+    if args.mock:
+        args.url, processes, workdir = start_mock_stack(args)
+        print(f"server {args.url} (log: {os.path.join(workdir, 'server.log')})")
+
+    capacity = None
+    try:
+        for level in args.levels:
+            p95, error_rate = asyncio.run(run_level(args, utterances, level))
+            if p95 is None or p95 > args.max_ttfa_p95 or error_rate > args.max_error_rate:
+                print(f"-> over the limit at {level} callers "
+                      f"(p95 {p95 or float('nan'):.0f}ms, errors {error_rate:.1%})")
+                break
+            capacity = level
+    except KeyboardInterrupt:
+        print("\n중단되었습니다.")
+    finally:
+        for process in processes:
+            process.terminate()
+            with contextlib.suppress(subprocess.TimeoutExpired):
+                process.wait(timeout=5)
+
+    if capacity is None:
+        print(f"\ncapacity: below {args.levels[0]} callers at p95 <= {args.max_ttfa_p95:.0f}ms")
+        return 1
+    print(f"\ncapacity: at least {capacity} concurrent callers at p95 <= {args.max_ttfa_p95:.0f}ms "
+          f"and <= {args.max_error_rate:.0%} errors")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,360 @@
+"""Local stand-ins for the three services full_pipeline talks to.
+
+    python mock_servers.py                  # run them standalone and print the env to point the pipeline at them
+
+- OpenAI: POST /v1/chat/completions streams a canned Korean reply as SSE
+  chat.completion.chunk events after first_token_ms, at tokens_per_second.
+- ElevenLabs: a stream-input websocket that answers every text chunk with
+  base64 audio (and alignment) after audio_delay_ms, sized at ms_per_char.
+- Google STT: a plaintext StreamingRecognize gRPC server that runs an
+  energy detector over the received audio and returns scripted transcripts
+  as interim results and a final result after final_silence_ms of silence
+  (or as soon as the client half-closes).
+"""
+import argparse
+import array
+import asyncio
+import base64
+import collections
+import datetime
+import json
+import os
+import threading
+import time
+from concurrent import futures
+from urllib.parse import parse_qs, urlparse
+
+import grpc
+import websockets
+from google.cloud import speech
+
+CANNED_REPLY = ("네, 좋은 질문이에요. 오늘은 날씨가 맑고 기온이 조금 높아서 가벼운 옷차림이 좋겠어요. "
+                "오후에는 바람이 불 수 있으니 얇은 겉옷을 챙기시는 걸 추천드려요.")
+DEFAULT_TRANSCRIPTS = ["오늘 날씨 어때", "점심 메뉴 추천해 줘", "내일 일정 알려 줘", "재미있는 이야기 해 줘"]
+AUDIO_BYTES_PER_MS = 16         # mp3_44100_128, what the pipeline's player assumes
+
+
+def split_tokens(text, size=2):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class MockOpenAI:
+    """Minimal HTTP/1.1 server (keep-alive, chunked SSE) for the chat completions endpoint.
+
+    Usage reports imitate OpenAI prompt caching: a prompt sharing at least
+    1024 leading tokens with an earlier one reports that prefix, in
+    128-token steps, as cached_tokens (one token per two characters).
+    """
+
+    def __init__(self, first_token_ms=300, tokens_per_second=60, reply=CANNED_REPLY):
+        self.first_token_ms = first_token_ms
+        self.tokens_per_second = tokens_per_second
+        self.reply = reply
+        self.requests = 0
+        self.port = None
+        self._server = None
+        self._prompts = collections.deque(maxlen=32)
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if method == "POST" and path.startswith("/v1/chat/completions"):
+                    await self._chat(writer, json.loads(body or b"{}"))
+                elif method == "GET" and path.startswith("/v1/models"):
+                    model = path.rsplit("/", 1)[-1]
+                    self._respond(writer, 200, {"id": model, "object": "model", "created": 0, "owned_by": "mock"})
+                else:
+                    self._respond(writer, 404, {"error": {"message": f"no route for {method} {path}"}})
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _respond(writer, status, payload):
+        body = json.dumps(payload).encode()
+        writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Not Found'}\r\n"
+                     f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+
+    @staticmethod
+    def _chunk(writer, payload):
+        data = f"data: {payload}\n\n".encode()
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+    def _prompt_usage(self, messages):
+        prompt = "".join(f"<{m.get('role')}>{m.get('content') or ''}" for m in messages)
+        shared = max((len(os.path.commonprefix([prompt, earlier])) for earlier in self._prompts), default=0)
+        self._prompts.append(prompt)
+        cached = shared // 2 // 128 * 128
+        return len(prompt) // 2, cached if cached >= 1024 else 0
+
+    async def _chat(self, writer, request):
+        self.requests += 1
+        model = request.get("model", "mock")
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        await writer.drain()
+
+        def event(delta, finish_reason=None, **extra):
+            return json.dumps({"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                               "model": model, "choices": [{"index": 0, "delta": delta,
+                                                            "finish_reason": finish_reason}], **extra},
+                              ensure_ascii=False)
+
+        await asyncio.sleep(self.first_token_ms / 1000)
+        self._chunk(writer, event({"role": "assistant", "content": ""}))
+        tokens = split_tokens(self.reply)
+        for token in tokens:
+            self._chunk(writer, event({"content": token}))
+            await writer.drain()
+            await asyncio.sleep(1 / self.tokens_per_second)
+        self._chunk(writer, event({}, "stop"))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            prompt_tokens, cached_tokens = self._prompt_usage(request.get("messages", []))
+            self._chunk(writer, json.dumps({"id": "chatcmpl-mock", "object": "chat.completion.chunk",
+                                            "created": int(time.time()), "model": model, "choices": [],
+                                            "usage": {"prompt_tokens": prompt_tokens,
+                                                      "completion_tokens": len(tokens),
+                                                      "total_tokens": prompt_tokens + len(tokens),
+                                                      "prompt_tokens_details": {"cached_tokens": cached_tokens}}}))
+        self._chunk(writer, "[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+class MockElevenLabs:
+    """stream-input websocket: one audio message per text message, in order, after audio_delay_ms."""
+
+    def __init__(self, audio_delay_ms=250, ms_per_char=70):
+        self.audio_delay_ms = audio_delay_ms
+        self.ms_per_char = ms_per_char
+        self.sessions = 0
+        self.port = None
+        self._server = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._server = await websockets.serve(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    @staticmethod
+    def _bytes_per_ms(path):
+        output_format = parse_qs(urlparse(path).query).get("output_format", ["mp3_44100_128"])[-1]
+        if output_format.startswith("pcm_"):
+            return int(output_format[len("pcm_"):]) * 2 / 1000
+        return AUDIO_BYTES_PER_MS
+
+    def _audio_message(self, text, bytes_per_ms=AUDIO_BYTES_PER_MS):
+        duration_ms = len(text) * self.ms_per_char
+        starts = [i * self.ms_per_char for i in range(len(text))]
+        size = int(duration_ms * bytes_per_ms)
+        return json.dumps({
+            "audio": base64.b64encode(bytes(size)).decode(),
+            "isFinal": False,
+            "alignment": {"chars": list(text), "charStartTimesMs": starts,
+                          "charDurationsMs": [self.ms_per_char] * len(text)},
+        }, ensure_ascii=False)
+
+    async def _handle(self, websocket, path=None):
+        self.sessions += 1
+        queue = asyncio.Queue()
+        # websockets < 14 passes the path or sets websocket.path; the new asyncio server only has request.path
+        bytes_per_ms = self._bytes_per_ms(path or getattr(websocket, "path", None) or websocket.request.path)
+
+        async def synthesize():
+            while True:
+                text = await queue.get()
+                if text is None:
+                    await websocket.send(json.dumps({"isFinal": True}))
+                    await websocket.close()
+                    return
+                await asyncio.sleep(self.audio_delay_ms / 1000)
+                await websocket.send(self._audio_message(text, bytes_per_ms))
+
+        worker = asyncio.ensure_future(synthesize())
+        try:
+            initialized = ended = False
+            async for message in websocket:
+                text = json.loads(message).get("text")
+                if not initialized:
+                    initialized = True      # BOS message with settings and the key
+                    continue
+                if text == "":
+                    ended = True
+                    queue.put_nowait(None)
+                elif text and text.strip():
+                    queue.put_nowait(text)
+            if ended:
+                await worker
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            worker.cancel()
+
+
+class MockSpeech:
+    """StreamingRecognize over plaintext gRPC, driven by an energy detector instead of a model."""
+
+    def __init__(self, transcripts=None, final_silence_ms=800, ms_per_char=120, energy_threshold=500,
+                 max_streams=512):
+        self.transcripts = list(transcripts or DEFAULT_TRANSCRIPTS)
+        self.max_streams = max_streams      # every open stream holds a server thread
+        self.final_silence_ms = final_silence_ms
+        self.ms_per_char = ms_per_char
+        self.energy_threshold = energy_threshold
+        self.utterances = 0
+        self.port = None
+        self._server = None
+        self._lock = threading.Lock()
+
+    def start(self, host="127.0.0.1", port=0):
+        handler = grpc.method_handlers_generic_handler("google.cloud.speech.v1.Speech", {
+            "StreamingRecognize": grpc.stream_stream_rpc_method_handler(
+                self._recognize,
+                request_deserializer=speech.StreamingRecognizeRequest.deserialize,
+                response_serializer=speech.StreamingRecognizeResponse.serialize,
+            ),
+        })
+        self._server = grpc.server(futures.ThreadPoolExecutor(max_workers=self.max_streams))
+        self._server.add_generic_rpc_handlers((handler,))
+        self.port = self._server.add_insecure_port(f"{host}:{port}")
+        self._server.start()
+        return self
+
+    def close(self):
+        self._server.stop(grace=0)
+
+    def _next_transcript(self):
+        with self._lock:
+            transcript = self.transcripts[self.utterances % len(self.transcripts)]
+            self.utterances += 1
+            return transcript
+
+    @staticmethod
+    def _response(transcript, end_ms, is_final):
+        return speech.StreamingRecognizeResponse(results=[speech.StreamingRecognitionResult(
+            alternatives=[speech.SpeechRecognitionAlternative(transcript=transcript, confidence=0.9)],
+            is_final=is_final,
+            stability=0.9 if is_final else 0.5,
+            result_end_time=datetime.timedelta(milliseconds=end_ms),
+        )])
+
+    def _recognize(self, requests, context):
+        rate = 16000
+        audio_ms = 0.0
+        speech_ms = 0.0
+        last_speech_ms = None
+        transcript = None
+        revealed = 0
+        for request in requests:
+            if "streaming_config" in request:
+                rate = request.streaming_config.config.sample_rate_hertz or rate
+                continue
+            samples = array.array("h", request.audio_content[:len(request.audio_content) // 2 * 2])
+            frame = rate // 50     # 20 ms
+            for i in range(0, len(samples), frame):
+                window = samples[i:i + frame]
+                audio_ms += len(window) * 1000 / rate
+                if window and sum(s * s for s in window) / len(window) >= self.energy_threshold ** 2:
+                    speech_ms += len(window) * 1000 / rate
+                    last_speech_ms = audio_ms
+                    if transcript is None:
+                        transcript = self._next_transcript()
+
+            if transcript is None:
+                continue
+            if audio_ms - last_speech_ms >= self.final_silence_ms:
+                yield self._response(transcript, last_speech_ms, True)
+                transcript, revealed, speech_ms = None, 0, 0.0
+                continue
+            shown = min(len(transcript), max(1, int(speech_ms / self.ms_per_char)))
+            if shown > revealed:
+                revealed = shown
+                yield self._response(transcript[:shown], audio_ms, False)
+
+        if transcript is not None:
+            # half-close (local endpointing): the real service finalizes right away
+            yield self._response(transcript, last_speech_ms, True)
+
+
+class MockServers:
+    """Runs all three stand-ins on a private event loop thread."""
+
+    def __init__(self, openai=None, elevenlabs=None, stt=None):
+        self.openai = openai or MockOpenAI()
+        self.elevenlabs = elevenlabs or MockElevenLabs()
+        self.stt = stt or MockSpeech()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="mock-servers", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.openai.start(), self._loop).result()
+        asyncio.run_coroutine_threadsafe(self.elevenlabs.start(), self._loop).result()
+        self.stt.start()
+        return self
+
+    def env(self):
+        return {
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{self.openai.port}/v1",
+            "OPENAI_API_KEY": "mock",
+            "ELEVENLABS_WS_BASE": f"ws://127.0.0.1:{self.elevenlabs.port}/v1/text-to-speech",
+            "ELEVENLABS_API_KEY": "mock",
+            "SPEECH_EMULATOR_HOST": f"127.0.0.1:{self.stt.port}",
+        }
+
+    def stop(self):
+        self.stt.close()
+        for server in (self.openai, self.elevenlabs):
+            asyncio.run_coroutine_threadsafe(server.close(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--first-token-ms', type=int, default=300)
+    parser.add_argument('--tokens-per-second', type=float, default=60)
+    parser.add_argument('--tts-delay-ms', type=int, default=250)
+    parser.add_argument('--final-silence-ms', type=int, default=800)
+    args = parser.parse_args()
+
+    servers = MockServers(MockOpenAI(args.first_token_ms, args.tokens_per_second),
+                          MockElevenLabs(args.tts_delay_ms),
+                          MockSpeech(final_silence_ms=args.final_silence_ms)).start()
+    for name, value in servers.env().items():
+        print(f"export {name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servers.stop()
+
+
+if __name__ == "__main__":
+    main()
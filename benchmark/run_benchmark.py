@@ -0,0 +1,170 @@
+"""End-to-end latency benchmark for full_pipeline against local mock services.
+
+    python run_benchmark.py                         # 20 turns with a synthetic utterance
+    python run_benchmark.py --turns 50 samples/*.wav
+    python run_benchmark.py --endpointing finalize --max-ttfa-p95 1500
+
+No API keys, microphone or mpv are needed: the real recognizer, LLM
+streaming, ElevenLabs websocket pool and player run against the servers in
+mock_servers.py, audio is replayed in real time from WAV files (16-bit mono
+16 kHz; a "<name>.txt" next to a file is used as its transcript) and the
+player writes to the null sink. Time-to-first-audio is measured from the end
+of speech to the first TTS audio chunk with the pipeline's own tracer.
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from mock_servers import MockElevenLabs, MockOpenAI, MockServers, MockSpeech
+
+PIPELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "full_pipeline")
+sys.path.insert(0, os.path.abspath(PIPELINE_DIR))
+from audio_source import ScriptedSource, read_wav_pcm
+
+SAMPLE_RATE = 16000
+
+
+def synthetic_utterance(duration_ms=1200, rate=SAMPLE_RATE):
+    # a 200 Hz tone with a 4 Hz "syllable" envelope, loud enough for any energy/VAD detector
+    samples = []
+    for i in range(rate * duration_ms // 1000):
+        t = i / rate
+        envelope = 0.55 + 0.45 * math.sin(2 * math.pi * 4 * t)
+        samples.append(int(8000 * envelope * math.sin(2 * math.pi * 200 * t)))
+    return b"".join(s.to_bytes(2, "little", signed=True) for s in samples)
+
+
+def percentiles(values):
+    from tracing import percentile
+    values = sorted(values)
+    return {p: percentile(values, p) for p in (50, 95, 99)}
+
+
+def format_distribution(name, values, unit):
+    if not values:
+        return f"{name:<26}n/a"
+    p = percentiles(values)
+    return (f"{name:<26}n={len(values):<5}p50 {p[50]:>8.1f}{unit}  p95 {p[95]:>8.1f}{unit}  "
+            f"p99 {p[99]:>8.1f}{unit}  mean {statistics.mean(values):>8.1f}{unit}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='WAV utterances to replay (default: synthetic)')
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--warmup-turns', type=int, default=1, help='Turns left out of the report')
+    parser.add_argument('--first-token-ms', type=int, default=300)
+    parser.add_argument('--tokens-per-second', type=float, default=60)
+    parser.add_argument('--tts-delay-ms', type=int, default=250)
+    parser.add_argument('--final-silence-ms', type=int, default=800, help="Mock Google's end-of-speech delay")
+    parser.add_argument('--endpointing', choices=['off', 'finalize', 'interim'], default='off')
+    parser.add_argument('--speculative-ms', type=int, default=None, help='Enable speculative LLM start')
+    parser.add_argument('--output-format', default='mp3_44100_128', help='ElevenLabs output format, e.g. pcm_16000')
+    parser.add_argument('--response-cache', action='store_true', help='Enable the exact-match response cache')
+    parser.add_argument('--trace', default=None, help='Keep the per-turn JSONL trace at this path')
+    parser.add_argument('--max-ttfa-p95', type=float, default=None,
+                        help='Exit with status 1 if p95 time-to-first-audio exceeds this many ms')
+    args = parser.parse_args()
+
+    if args.files:
+        utterances = [read_wav_pcm(path, SAMPLE_RATE) for path in args.files]
+        transcripts = []
+        for path in args.files:
+            sidecar = os.path.splitext(path)[0] + ".txt"
+            if os.path.exists(sidecar):
+                with open(sidecar, encoding='utf-8') as f:
+                    transcripts.append(f.read().strip())
+        transcripts = transcripts if len(transcripts) == len(args.files) else None
+    else:
+        utterances, transcripts = [synthetic_utterance()], None
+
+    servers = MockServers(MockOpenAI(args.first_token_ms, args.tokens_per_second),
+                          MockElevenLabs(args.tts_delay_ms),
+                          MockSpeech(transcripts, final_silence_ms=args.final_silence_ms)).start()
+    # the pipeline reads its endpoints and writes its history at import time
+    os.environ.update(servers.env())
+    trace_path = os.path.abspath(args.trace) if args.trace else None
+    workdir = tempfile.mkdtemp(prefix="pipeline-bench-")
+    os.chdir(workdir)
+    trace_path = trace_path or os.path.join(workdir, "trace.jsonl")
+
+    import tts_gpt_elevenlabs as pipeline
+    from stt_google_cloud import StreamingRecognizer
+    from tracing import tracer
+
+    tracer.enable(trace_path)
+    # only OpenAI is mocked: a real Groq request must never join the race (or the bill)
+    pipeline.configure_llm(fallback=False)
+    if args.response_cache:
+        pipeline.configure_response_cache()
+    pipeline.start_runtime("null", args.speculative_ms, output_format=args.output_format)
+    endpointer = None
+    if args.endpointing != 'off':
+        from endpointing import Endpointer
+        endpointer = Endpointer(SAMPLE_RATE, mode="energy")
+    source = ScriptedSource()
+    recognizer = StreamingRecognizer(endpointer=endpointer, endpoint_mode=args.endpointing,
+                                     on_interim=pipeline.on_interim if args.speculative_ms else None, source=source)
+
+    turn_seconds, audio_seconds = [], []
+    started = time.monotonic()
+    measured_from = None
+    try:
+        for i in range(args.turns):
+            if i == args.warmup_turns:
+                measured_from = (time.monotonic(), pipeline.player.sink.bytes_written)
+            turn_started = time.monotonic()
+            audio_before = pipeline.player.sink.bytes_written
+            threading.Timer(0.3, source.say, [utterances[i % len(utterances)]]).start()
+            query = recognizer.get_transcript()
+            if query is None:
+                print(f"turn {i + 1}: no transcript")
+                continue
+            pipeline.process_query(query, verbose=True)
+            if i >= args.warmup_turns:
+                turn_seconds.append(time.monotonic() - turn_started)
+                audio_seconds.append((pipeline.player.sink.bytes_written - audio_before)
+                                     / pipeline.player.bytes_per_second)
+            print(f"turn {i + 1}/{args.turns}: {query}")
+        finished = time.monotonic()
+    finally:
+        recognizer.close()
+        pipeline.stop_runtime()
+        tracer.close()
+        servers.stop()
+
+    with open(trace_path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()][args.warmup_turns:]
+    ttfa = [r["stages_ms"]["tts_first_audio"] for r in records
+            if r["origin"] == "speech_end" and "tts_first_audio" in r["stages_ms"]]
+    first_token = [r["stages_ms"]["llm_first_token"] for r in records
+                   if r["origin"] == "speech_end" and "llm_first_token" in r["stages_ms"]]
+
+    print()
+    print(format_distribution("time to first audio", ttfa, "ms"))
+    print(format_distribution("time to first token", first_token, "ms"))
+    print(format_distribution("turn wall time", [s * 1000 for s in turn_seconds], "ms"))
+    print(format_distribution("audio per turn", audio_seconds, "s"))
+    if measured_from is not None:
+        elapsed = finished - measured_from[0]
+        audio = (pipeline.player.sink.bytes_written - measured_from[1]) / pipeline.player.bytes_per_second
+        print(f"throughput: {len(turn_seconds) / elapsed * 60:.1f} turns/min, "
+              f"{audio / elapsed:.2f} audio s per wall s")
+    print(f"trace: {trace_path}  (total {time.monotonic() - started:.1f}s)")
+
+    if args.max_ttfa_p95 is not None:
+        p95 = percentiles(ttfa)[95] if ttfa else None
+        if p95 is None or p95 > args.max_ttfa_p95:
+            print(f"time-to-first-audio p95 {p95}ms exceeds {args.max_ttfa_p95}ms")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
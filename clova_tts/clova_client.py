@@ -0,0 +1,161 @@
+import asyncio
+import os
+import random
+import threading
+
+import httpx
+
+ENDPOINT = "https://naveropenapi.apigw.ntruss.com/tts-premium/v1/tts"
+RETRY_STATUS = {429, 500, 502, 503, 504}
+CHUNK_SIZE = 16384
+
+
+class ClovaTtsError(Exception):
+    def __init__(self, message, status=None, body=None):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+class ClovaTtsClient:
+    """Async Clova Premium TTS client over one pooled keep-alive httpx connection pool.
+
+    Audio is streamed from the socket in CHUNK_SIZE pieces, so memory stays
+    flat however long the text is. Connection errors, timeouts, 429 and 5xx
+    responses are retried up to `retries` times with exponential backoff and
+    jitter; other HTTP errors raise ClovaTtsError right away.
+    """
+
+    def __init__(self, client_id=None, client_secret=None, endpoint=ENDPOINT, timeout=30.0, connect_timeout=5.0,
+                 retries=3, backoff=0.5, max_backoff=8.0, max_connections=8, keepalive_expiry=60.0):
+        self.client_id = client_id or os.getenv("CLOVA_TTS_CLIENT_ID")
+        self.client_secret = client_secret or os.getenv("CLOVA_TTS_CLIENT_SECRET")
+        if not self.client_id or not self.client_secret:
+            raise EnvironmentError("Set CLOVA_TTS_CLIENT_ID and CLOVA_TTS_CLIENT_SECRET in .env file")
+        self.endpoint = endpoint
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.requests = 0
+        self.retried = 0
+        self._http = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                                keepalive_expiry=keepalive_expiry),
+            headers={"X-NCP-APIGW-API-KEY-ID": self.client_id, "X-NCP-APIGW-API-KEY": self.client_secret},
+        )
+
+    @staticmethod
+    def form(text, settings, audio_format="wav", sampling_rate=16000):
+        return {
+            "speaker": settings["speaker"],
+            "volume": settings["volume"],
+            "speed": settings["speed"],
+            "pitch": settings["pitch"],
+            "emotion": settings["emotion"],
+            "emotion-strength": settings["emotion_strength"],
+            "format": audio_format,
+            "sampling-rate": sampling_rate,
+            "text": text,
+        }
+
+    def _delay(self, attempt):
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    async def stream(self, text, settings, **kwargs):
+        """Yield audio chunks. A retry after partial output is only possible before the first chunk."""
+        data = self.form(text, settings, **kwargs)
+        attempt = 0
+        while True:
+            self.requests += 1
+            yielded = False
+            try:
+                async with self._http.stream("POST", self.endpoint, data=data) as response:
+                    if response.status_code != 200:
+                        body = (await response.aread()).decode("utf-8", "replace")
+                        if response.status_code in RETRY_STATUS and attempt < self.retries:
+                            raise _Retry(response.headers.get("retry-after"))
+                        raise ClovaTtsError(f"HTTP {response.status_code}", response.status_code, body)
+                    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                        yielded = True
+                        yield chunk
+                return
+            except _Retry as retry:
+                delay = min(retry.after, self.max_backoff) if retry.after is not None else self._delay(attempt)
+            except httpx.TransportError as e:
+                if yielded or attempt >= self.retries:
+                    raise ClovaTtsError(f"request failed: {e}") from e
+                delay = self._delay(attempt)
+            attempt += 1
+            self.retried += 1
+            await asyncio.sleep(delay)
+
+    async def synthesize_to_file(self, text, out_path, settings, **kwargs):
+        """Stream into out_path (via a temp file, so a failed attempt never leaves a truncated file).
+
+        The whole request is retried if the body breaks off midway. Returns the byte count.
+        """
+        tmp = f"{out_path}.part"
+        attempt = 0
+        while True:
+            size = 0
+            try:
+                with open(tmp, "wb") as f:
+                    async for chunk in self.stream(text, settings, **kwargs):
+                        f.write(chunk)
+                        size += len(chunk)
+                os.replace(tmp, out_path)
+                return size
+            except ClovaTtsError:
+                # stream() only gives up mid-body without retrying; the whole request can still be repeated
+                if size == 0 or attempt >= self.retries:
+                    raise
+                attempt += 1
+                self.retried += 1
+                await asyncio.sleep(self._delay(attempt))
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+    async def close(self):
+        await self._http.aclose()
+
+
+class _Retry(Exception):
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        try:
+            self.after = float(retry_after) if retry_after is not None else None
+        except ValueError:
+            self.after = None
+
+
+class _BackgroundLoop:
+    """One event loop thread shared by every sync call, so pooled connections survive between calls."""
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def run(self, coro):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="clova-tts", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+
+_background = _BackgroundLoop()
+_client = None
+
+
+def run_sync(coro):
+    return _background.run(coro)
+
+
+def get_client():
+    """The process-wide client the sync wrapper uses (created on first call)."""
+    global _client
+    if _client is None:
+        _client = ClovaTtsClient()
+    return _client
@@ -1,8 +1,11 @@
 import os
-import urllib.request
-import urllib.parse
+import sys
 from dotenv import load_dotenv
-from typing import TypedDict
+from typing import Optional, TypedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tts_cache import cache_key, default_cache
+from clova_client import ClovaTtsError, get_client, run_sync
 
 load_dotenv()
 
@@ -14,7 +17,7 @@ class VoiceSettings(TypedDict):
     emotion: int
     emotion_strength: int
 
-ENDPOINT = "https://naveropenapi.apigw.ntruss.com/tts-premium/v1/tts"
+OUTPUT_FORMAT = "wav_16000"
 
 def get_default_voice_settings() -> VoiceSettings:
     return VoiceSettings(
@@ -26,58 +29,43 @@ def get_default_voice_settings() -> VoiceSettings:
         emotion_strength=2
     )
 
-def clova_tts(text: str, out_path: str = "output.wav") -> None:
-    client_id = os.getenv("CLOVA_TTS_CLIENT_ID")
-    client_secret = os.getenv("CLOVA_TTS_CLIENT_SECRET")
-    
-    if not client_id or not client_secret:
-        raise EnvironmentError("Set CLOVA_TTS_CLIENT_ID and CLOVA_TTS_CLIENT_SECRET in .env file")
-
-    # Build request
-    req = urllib.request.Request(ENDPOINT)
-    req.add_header("X-NCP-APIGW-API-KEY-ID", client_id)
-    req.add_header("X-NCP-APIGW-API-KEY", client_secret)
+def audio_key(text: str) -> str:
+    s = get_default_voice_settings()
+    return cache_key("clova", s['speaker'], "tts-premium", OUTPUT_FORMAT, s, text)
 
-    # Use exact same settings as original code
+def clova_tts(text: str, out_path: str = "output.wav") -> Optional[str]:
+    """Synthesize text into out_path; returns out_path, or None if the request failed."""
     s = get_default_voice_settings()
-    
-    # Build query string exactly like original code
-    query = f"speaker={s['speaker']}" + \
-            f"&volume={s['volume']}" + \
-            f"&speed={s['speed']}" + \
-            f"&pitch={s['pitch']}" + \
-            f"&emotion={s['emotion']}" + \
-            f"&emotion-strength={s['emotion_strength']}" + \
-            "&format=wav" + \
-            "&sampling-rate=16000" + \
-            f"&text={urllib.parse.quote(text)}"
-    
-    print(f"Using speaker: {s['speaker']}")
-    print(f"Query: {query}")
-    
+    cache = default_cache()
+    key = audio_key(text)
+    cached = cache.stream(key) if cache is not None else None
+    if cached is not None:
+        with open(out_path, 'wb') as f:
+            for chunk in cached:
+                f.write(chunk)
+        print(f"Success (cached): Audio saved to {out_path}")
+        return out_path
+
+    client = get_client()
+
+    print(f"Using speaker: {s['speaker']} ({len(text)} chars)")
+
     try:
-        response = urllib.request.urlopen(req, data=query.encode('utf-8'))
-        rescode = response.getcode()
-        
-        if rescode == 200:
-            response_body = response.read()
-            with open(out_path, 'wb') as f:
-                f.write(response_body)
-            print(f"Success: Audio saved to {out_path}")
-        else:
-            print(f"Failed: HTTP {rescode}")
-            print(f"Response: {response.read()}")
-            
-    except urllib.error.HTTPError as e:
-        print(f"HTTPError: {e.code} - {e.reason}")
-        try:
-            error_response = e.read().decode('utf-8')
-            print(f"Error response: {error_response}")
-        except:
-            print("Could not read error response")
-            
+        size = run_sync(client.synthesize_to_file(text, out_path, s))
+        if cache is not None:
+            cache.store_file(key, out_path)
+        print(f"Success: Audio saved to {out_path} ({size} bytes)")
+        return out_path
+
+    except ClovaTtsError as e:
+        print(f"Failed: {e}")
+        if e.body:
+            print(f"Error response: {e.body}")
+
     except Exception as e:
         print(f"Error occurred: {e}")
 
+    return None
+
 if __name__ == "__main__":
     clova_tts("안녕하세요. 클로바 TTS 테스트입니다.")
@@ -1,11 +1,15 @@
 # https://elevenlabs.io/docs/cookbooks/text-to-speech/streaming
 
 import os
+import sys
 import uuid
 from dotenv import load_dotenv
 from elevenlabs import VoiceSettings
 from elevenlabs.client import ElevenLabs
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tts_cache import cache_key, default_cache
+
 load_dotenv()
 
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
@@ -13,29 +17,46 @@ elevenlabs = ElevenLabs(
     api_key=ELEVENLABS_API_KEY,
 )
 
+VOICE_ID = "ZJCNdZEjYwkOElxugmW2" # Adam pre-made voice
+MODEL_ID = "eleven_turbo_v2_5" # use the turbo model for low latency
+OUTPUT_FORMAT = "mp3_22050_32"
+# Optional voice settings that allow you to customize the output
+VOICE_SETTINGS = dict(
+    stability=0.0,
+    similarity_boost=1.0,
+    style=0.0,
+    use_speaker_boost=True,
+    speed=1.0,
+)
+
+
+def audio_key(text: str) -> str:
+    return cache_key("elevenlabs", VOICE_ID, MODEL_ID, OUTPUT_FORMAT, VOICE_SETTINGS, text)
+
+
+def text_to_speech_file(text: str, save_file_path: str = None) -> str:
+    cache = default_cache()
+    key = audio_key(text)
+    response = cache.stream(key) if cache is not None else None
 
-def text_to_speech_file(text: str) -> str:
-    # Calling the text_to_speech conversion API with detailed parameters
-    response = elevenlabs.text_to_speech.convert(
-        voice_id="ZJCNdZEjYwkOElxugmW2", # Adam pre-made voice
-        output_format="mp3_22050_32",
-        text=text,
-        model_id="eleven_turbo_v2_5", # use the turbo model for low latency
-        # Optional voice settings that allow you to customize the output
-        voice_settings=VoiceSettings(
-            stability=0.0,
-            similarity_boost=1.0,
-            style=0.0,
-            use_speaker_boost=True,
-            speed=1.0,
-        ),
-    )
+    if response is None:
+        # Calling the text_to_speech conversion API with detailed parameters
+        response = elevenlabs.text_to_speech.convert(
+            voice_id=VOICE_ID,
+            output_format=OUTPUT_FORMAT,
+            text=text,
+            model_id=MODEL_ID,
+            voice_settings=VoiceSettings(**VOICE_SETTINGS),
+        )
+        if cache is not None:
+            response = cache.record(key, response)
 
     # uncomment the line below to play the audio back
     # play(response)
 
     # Generating a unique file name for the output MP3 file
-    save_file_path = f"{uuid.uuid4()}.mp3"
+    if save_file_path is None:
+        save_file_path = f"{uuid.uuid4()}.mp3"
 
     # Writing the audio to a file
     with open(save_file_path, "wb") as f:
@@ -1,12 +1,20 @@
 # https://elevenlabs.io/docs/cookbooks/text-to-speech/streaming
 
+import io
 import os
+import queue
+import sys
+import threading
+import weakref
 from typing import IO
 from io import BytesIO
 from dotenv import load_dotenv
 from elevenlabs import VoiceSettings
 from elevenlabs.client import ElevenLabs
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tts_cache import cache_key, default_cache
+
 load_dotenv()
 
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
@@ -14,23 +22,145 @@ elevenlabs = ElevenLabs(
     api_key=ELEVENLABS_API_KEY,
 )
 
+VOICE_ID = "EXAVITQu4vr4xnSDxMaL" # Bella / (Adam pre-made voice)
+MODEL_ID = "eleven_multilingual_v2"
+OUTPUT_FORMAT = "mp3_22050_32"
+# Optional voice settings that allow you to customize the output
+VOICE_SETTINGS = dict(
+    stability=0.0,
+    similarity_boost=1.0,
+    style=0.0,
+    use_speaker_boost=True,
+    speed=1.0,
+)
+PREFETCH_CHUNKS = 8
+_END = object()
+
+
+def _put_end(chunk_queue, stop):
+    while True:
+        try:
+            chunk_queue.put(_END, timeout=0.1)
+            return
+        except queue.Full:
+            if stop.is_set():
+                return
+
+
+def _pump(chunks, chunk_queue, stop, errors):
+    # a plain function, so the thread holds no reference to the StreamingAudio that owns it
+    iterator = iter(chunks)
+    try:
+        for chunk in iterator:
+            if not chunk:
+                continue
+            while not stop.is_set():
+                try:
+                    chunk_queue.put(chunk, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if stop.is_set():
+                break
+    except Exception as e:
+        errors.append(e)
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()     # an abandoned cache.record() drops its partial entry here
+        _put_end(chunk_queue, stop)
+
+
+class StreamingAudio(io.RawIOBase):
+    """Read-only file object over an audio chunk iterator.
+
+    A background thread pulls up to prefetch_chunks chunks ahead into a
+    bounded queue, so the first read() returns as soon as the first chunk
+    arrives and memory stays bounded however long the audio is. Iterating
+    yields the chunks as they came from the API. close(), or dropping the
+    object, stops the download.
+    """
+
+    def __init__(self, chunks, prefetch_chunks=PREFETCH_CHUNKS):
+        super().__init__()
+        self._queue = queue.Queue(maxsize=prefetch_chunks)
+        self._stop = threading.Event()
+        self._pending = b""
+        self._errors = []
+        self._done = False
+        self.bytes_read = 0
+        self._thread = threading.Thread(target=_pump, args=(chunks, self._queue, self._stop, self._errors),
+                                        name="tts-prefetch", daemon=True)
+        self._thread.start()
+        weakref.finalize(self, self._stop.set)
+
+    def _next_chunk(self):
+        if self._done:
+            return b""
+        chunk = self._queue.get()
+        if chunk is _END:
+            self._done = True
+            if self._errors:
+                raise self._errors[0]
+            return b""
+        return chunk
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._pending:
+            self._pending = self._next_chunk()
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        self.bytes_read += n
+        return n
+
+    def __iter__(self):
+        while True:
+            chunk, self._pending = self._pending or self._next_chunk(), b""
+            if not chunk:
+                return
+            self.bytes_read += len(chunk)
+            yield chunk
+
+    def close(self):
+        # the prefetch thread notices the flag at its next chunk and closes the response
+        self._stop.set()
+        self._done = True
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        super().close()
+
+
+def text_to_speech_stream(text: str, buffered: bool = False, prefetch_chunks: int = PREFETCH_CHUNKS) -> IO[bytes]:
+    """Audio for text as a file object that streams while the API is still synthesizing.
+
+    buffered=True keeps the old behaviour: the whole response is read into a
+    BytesIO before returning.
+    """
+    cache = default_cache()
+    key = cache_key("elevenlabs", VOICE_ID, MODEL_ID, OUTPUT_FORMAT, VOICE_SETTINGS, text)
+    response = cache.stream(key) if cache is not None else None
+
+    if response is None:
+        # Perform the text-to-speech conversion
+        response = elevenlabs.text_to_speech.stream(
+            voice_id=VOICE_ID,
+            output_format=OUTPUT_FORMAT,
+            text=text,
+            model_id=MODEL_ID,
+            voice_settings=VoiceSettings(**VOICE_SETTINGS),
+        )
+        if cache is not None:
+            response = cache.record(key, response)
 
-def text_to_speech_stream(text: str) -> IO[bytes]:
-    # Perform the text-to-speech conversion
-    response = elevenlabs.text_to_speech.stream(
-        voice_id="EXAVITQu4vr4xnSDxMaL", # Bella / (Adam pre-made voice)
-        output_format="mp3_22050_32",
-        text=text,
-        model_id="eleven_multilingual_v2",
-        # Optional voice settings that allow you to customize the output
-        voice_settings=VoiceSettings(
-            stability=0.0,
-            similarity_boost=1.0,
-            style=0.0,
-            use_speaker_boost=True,
-            speed=1.0,
-        ),
-    )
+    if not buffered:
+        return StreamingAudio(response, prefetch_chunks)
 
     # Create a BytesIO object to hold the audio data in memory
     audio_stream = BytesIO()
@@ -47,4 +177,5 @@ def text_to_speech_stream(text: str) -> IO[bytes]:
     return audio_stream
 
 if __name__ == "__main__":
-    text_to_speech_stream("안녕하세요, 저는 bella입니다. 만나서 반가워요.")
\ No newline at end of file
+    with text_to_speech_stream("안녕하세요, 저는 bella입니다. 만나서 반가워요.") as audio:
+        print(f"{sum(len(chunk) for chunk in audio)} bytes streamed")
\ No newline at end of file
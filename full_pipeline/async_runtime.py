@@ -0,0 +1,67 @@
+import asyncio
+import concurrent.futures
+import threading
+
+
+class AsyncRuntime:
+    """One event loop for the whole conversation, running on a background thread.
+
+    The console loop in main.py is synchronous, so coroutines are handed over
+    with submit()/run() instead of asyncio.run(), which would build and tear
+    down a fresh loop (and every connection bound to it) on each turn.
+    """
+
+    def __init__(self, name="pipeline-runtime"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if not self._thread.is_alive() and not self.loop.is_closed():
+                self._thread.start()
+        self._ready.wait()
+        return self
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._ready.set)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(self._cancel_pending())
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+
+    async def _cancel_pending(self):
+        tasks = [t for t in asyncio.all_tasks(self.loop) if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except (KeyboardInterrupt, concurrent.futures.TimeoutError):
+            future.cancel()
+            raise
+
+    def call_soon(self, callback, *args):
+        self.start()
+        return self.loop.call_soon_threadsafe(callback, *args)
+
+    def stop(self, timeout=5.0):
+        if not self._thread.is_alive():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
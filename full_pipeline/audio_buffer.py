@@ -0,0 +1,101 @@
+import threading
+
+
+class PcmRingBuffer:
+    """Fixed-capacity, preallocated PCM buffer written by the capture callback.
+
+    Positions are absolute byte offsets since the stream was opened, so a
+    reader can be pointed back at audio it has already seen (bridging
+    replay) as long as it is still within the last `capacity` bytes.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity - capacity % 2      # keep 16-bit samples aligned
+        self._buf = bytearray(self.capacity)
+        self._view = memoryview(self._buf)
+        self._cond = threading.Condition()
+        self.write_pos = 0
+        self.closed = False
+
+    @property
+    def oldest_pos(self):
+        return max(0, self.write_pos - self.capacity)
+
+    def write(self, data):
+        n = len(data)
+        if n > self.capacity:
+            data = memoryview(data)[n - self.capacity:]
+            n = self.capacity
+        with self._cond:
+            start = self.write_pos % self.capacity
+            first = min(n, self.capacity - start)
+            self._view[start:start + first] = data[:first]
+            if first < n:
+                self._view[:n - first] = data[first:]
+            self.write_pos += n
+            self._cond.notify_all()
+
+    def read_range(self, start_pos, end_pos) -> bytes:
+        """Copy out [start_pos, end_pos); the caller must hold the lock or own a stable range."""
+        start = start_pos % self.capacity
+        length = end_pos - start_pos
+        if start + length <= self.capacity:
+            return bytes(self._view[start:start + length])
+        return b"".join((self._view[start:], self._view[:start + length - self.capacity]))
+
+    def reader(self, start_pos=None):
+        with self._cond:
+            reader = RingReader(self, self.write_pos if start_pos is None else start_pos)
+            self._cond.notify_all()     # writers waiting in wait_for_reader() follow the new cursor
+        return reader
+
+    def wait_for_reader(self, position, lag=0):
+        """Block until write_pos - position() <= lag, or the ring is closed.
+
+        position() is called under the lock and returns the cursor a writer
+        must not get too far ahead of; a reader advancing wakes the wait.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.closed or self.write_pos - position() <= lag)
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class RingReader:
+    """A cursor into PcmRingBuffer. Audio overwritten before it was read is counted, not replayed."""
+
+    def __init__(self, ring, pos):
+        self.ring = ring
+        self.pos = max(pos, ring.oldest_pos)
+        self.overflow_bytes = 0
+        self.closed = False
+
+    def read(self, max_bytes, timeout=None):
+        """Block until audio is available and return up to max_bytes of it.
+
+        After the ring is closed the audio written before close() is still
+        returned; None means the reader is closed or has read everything.
+        """
+        ring = self.ring
+        with ring._cond:
+            ring._cond.wait_for(lambda: self.closed or ring.closed or ring.write_pos > self.pos, timeout)
+            if self.closed:
+                return None
+            if ring.write_pos <= self.pos:
+                return None if ring.closed else b""
+            if self.pos < ring.oldest_pos:
+                self.overflow_bytes += ring.oldest_pos - self.pos
+                self.pos = ring.oldest_pos
+            end = min(ring.write_pos, self.pos + max_bytes)
+            data = ring.read_range(self.pos, end)
+            self.pos = end
+            ring._cond.notify_all()
+            return data
+
+    def close(self):
+        with self.ring._cond:
+            self.closed = True
+            self.ring._cond.notify_all()
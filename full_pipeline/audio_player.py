@@ -0,0 +1,448 @@
+import asyncio
+import queue
+import shutil
+import subprocess
+import threading
+import time
+import wave
+
+MP3_44100_128_BPS = 16000       # bytes per second of the default stream-input output format
+DEFAULT_OUTPUT_FORMAT = "mp3_44100_128"
+PCM_SAMPLE_WIDTH = 2            # ElevenLabs pcm_* formats are 16-bit little-endian mono
+
+
+def pcm_sample_rate(output_format):
+    """Sample rate of a pcm_<rate> output format, None for MP3."""
+    if output_format and output_format.startswith("pcm_"):
+        return int(output_format[len("pcm_"):])
+    return None
+
+
+def bytes_per_second(output_format):
+    rate = pcm_sample_rate(output_format)
+    if rate is not None:
+        return rate * PCM_SAMPLE_WIDTH
+    if output_format and output_format.startswith("mp3_"):
+        return int(output_format.rsplit("_", 1)[-1]) * 1000 // 8
+    return MP3_44100_128_BPS
+
+_END = object()
+_DROP = object()
+
+
+class NullSink:
+    """Discards audio. Used for headless runs and tests."""
+    realtime = False
+
+    def __init__(self):
+        self.bytes_written = 0
+
+    def open(self):
+        pass
+
+    def write(self, chunk):
+        self.bytes_written += len(chunk)
+
+    def end_utterance(self):
+        pass
+
+    def abort(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FileSink(NullSink):
+    """Appends every utterance to a single file."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._file = None
+
+    def open(self):
+        self._file = open(self.path, 'ab')
+
+    def write(self, chunk):
+        super().write(chunk)
+        self._file.write(chunk)
+
+    def end_utterance(self):
+        self._file.flush()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class FrameAssembler:
+    """Cuts a byte stream into whole PCM frames; an odd trailing byte is carried into the next chunk.
+
+    Network chunks are not sample aligned, but device and WAV writes must be.
+    Aligned chunks pass through untouched, the rest are joined in one
+    reusable buffer.
+    """
+
+    def __init__(self, frame_bytes=PCM_SAMPLE_WIDTH):
+        self.frame_bytes = frame_bytes
+        self._buffer = bytearray()
+        self._carry = b""
+
+    def frames(self, chunk):
+        if not self._carry and len(chunk) % self.frame_bytes == 0:
+            return chunk
+        buffer = self._buffer
+        buffer[:] = self._carry
+        buffer += chunk
+        usable = len(buffer) - len(buffer) % self.frame_bytes
+        self._carry = bytes(buffer[usable:])
+        del buffer[usable:]
+        return buffer
+
+    def reset(self):
+        self._carry = b""
+
+
+class WavSink(NullSink):
+    """Writes PCM into one WAV file; the header is finalized on close."""
+
+    def __init__(self, path, sample_rate):
+        super().__init__()
+        self.path = path
+        self.sample_rate = sample_rate
+        self._file = None
+        self._frames = FrameAssembler()
+
+    def open(self):
+        self._file = wave.open(self.path, 'wb')
+        self._file.setnchannels(1)
+        self._file.setsampwidth(PCM_SAMPLE_WIDTH)
+        self._file.setframerate(self.sample_rate)
+
+    def write(self, chunk):
+        super().write(chunk)
+        self._file.writeframesraw(self._frames.frames(chunk))
+
+    def end_utterance(self):
+        self._frames.reset()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class PyAudioSink(NullSink):
+    """Plays PCM straight on the default output device: no container, no decoder, no extra process."""
+    realtime = True
+
+    def __init__(self, sample_rate, device_index=None):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.device_index = device_index
+        self._audio = None
+        self._stream = None
+        self._frames = FrameAssembler()
+
+    def open(self):
+        import pyaudio
+
+        if self._audio is None:
+            self._audio = pyaudio.PyAudio()
+        self._stream = self._audio.open(format=pyaudio.paInt16, channels=1, rate=self.sample_rate, output=True,
+                                        output_device_index=self.device_index)
+
+    def write(self, chunk):
+        super().write(chunk)
+        frames = self._frames.frames(chunk)
+        if frames:
+            self._stream.write(bytes(frames) if isinstance(frames, bytearray) else frames)
+
+    def end_utterance(self):
+        self._frames.reset()
+
+    def abort(self):
+        # called on the writer thread between writes; PortAudio only holds its device latency worth of audio
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.start_stream()
+        self._frames.reset()
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        if self._audio is not None:
+            self._audio.terminate()
+            self._audio = None
+
+
+class MpvSink(NullSink):
+    """One mpv process for the whole session, fed through stdin.
+
+    MP3 frames from consecutive utterances are simply concatenated, so the
+    demuxer and decoder are only probed once, at startup.
+    """
+    realtime = True
+
+    def __init__(self, extra_args=()):
+        super().__init__()
+        self.extra_args = list(extra_args)
+        self._process = None
+
+    def open(self):
+        if shutil.which("mpv") is None:
+            raise ValueError("mpv not found")
+        self._process = subprocess.Popen(
+            ["mpv", "--no-cache", "--no-terminal", *self.extra_args, "--", "fd://0"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def write(self, chunk):
+        super().write(chunk)
+        if self._process.poll() is not None:
+            self.open()
+        self._process.stdin.write(chunk)
+        self._process.stdin.flush()
+
+    def abort(self):
+        # mpv cannot drop what is already in its pipe, so restart it
+        self.close()
+        self.open()
+
+    def close(self):
+        if self._process is None:
+            return
+        try:
+            self._process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.terminate()
+        self._process.wait()
+        self._process = None
+
+
+def mpv_raw_args(sample_rate):
+    return ["--demuxer=rawaudio", "--demuxer-rawaudio-format=s16le", f"--demuxer-rawaudio-rate={sample_rate}",
+            "--demuxer-rawaudio-channels=1"]
+
+
+def create_sink(spec, output_format=DEFAULT_OUTPUT_FORMAT):
+    rate = pcm_sample_rate(output_format)
+    if spec == "mpv":
+        return MpvSink(mpv_raw_args(rate) if rate else ())
+    if spec == "pyaudio":
+        if rate is None:
+            raise ValueError("the pyaudio sink plays PCM only; use a pcm_* output format")
+        return PyAudioSink(rate)
+    if spec == "null":
+        return NullSink()
+    if spec.startswith("file:"):
+        path = spec[len("file:"):]
+        if rate and path.endswith(".wav"):
+            return WavSink(path, rate)
+        return FileSink(path)
+    raise ValueError(f"unknown audio sink: {spec}")
+
+
+class AudioPlayer:
+    """Long-lived playback engine: audio frames go through a queue to a writer thread.
+
+    Sinks that play in real time do not report when they finish, so the
+    player keeps a playback clock from the bytes written and the stream's
+    byte rate.
+
+    The queue is a jitter buffer. Each utterance (and playback after an
+    underrun, when a real-time sink ran dry mid-utterance) starts only once
+    preroll_ms of audio is queued or the utterance ends. feed_async() makes
+    the producer wait while more than max_buffer_ms is queued (an overrun),
+    which pushes back on the websocket instead of growing memory.
+    """
+
+    def __init__(self, sink, bytes_per_second=MP3_44100_128_BPS, preroll_ms=0, max_buffer_ms=8000):
+        self.sink = sink
+        self.bytes_per_second = bytes_per_second
+        self.preroll_bytes = preroll_ms * bytes_per_second // 1000
+        self.max_buffer_bytes = max(max_buffer_ms * bytes_per_second // 1000, self.preroll_bytes)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._drained = threading.Event()
+        self._drained.set()
+        self._lock = threading.Lock()
+        self._clock_end = 0.0
+        self._utterance_start = None
+        self._utterance_bytes = 0
+        self._new_utterance = True
+        self._muted = False
+        self._buffered = 0
+        self.interrupted_ms = None
+        self.stats = {"underruns": 0, "overruns": 0, "max_buffered_ms": 0}
+
+    def start(self):
+        if self._thread is None:
+            self.sink.open()
+            self._thread = threading.Thread(target=self._run, name="audio-player", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        held, held_bytes = [], 0
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if item is _DROP:
+                self._release(held_bytes)
+                held, held_bytes = [], 0
+                self._abort_sink()
+                continue
+            if item is _END:
+                self._write(held)
+                held, held_bytes = [], 0
+                self.sink.end_utterance()
+                self._new_utterance = True
+                self._drained.set()
+                continue
+            if not held:
+                starting = self._new_utterance
+                if not starting and self.sink.realtime and time.monotonic() > self._clock_end:
+                    self.stats["underruns"] += 1
+                    starting = True
+                if not starting or not self.preroll_bytes:
+                    self._write([item])
+                    continue
+            held.append(item)
+            held_bytes += len(item)
+            if held_bytes >= self.preroll_bytes:
+                self._write(held)
+                held, held_bytes = [], 0
+
+    def _write(self, items):
+        for item in items:
+            try:
+                self.sink.write(item)
+            except Exception as e:
+                print(f"오디오 재생 오류: {e}")
+            else:
+                self._advance_clock(len(item))
+            self._release(len(item))
+
+    def _abort_sink(self):
+        # only the writer thread touches the sink, so an abort never lands in the middle of a write
+        try:
+            self.sink.abort()
+        except Exception as e:
+            print(f"오디오 재생 오류: {e}")
+        with self._lock:
+            self._clock_end = time.monotonic()
+        self._new_utterance = True
+
+    def _release(self, nbytes):
+        with self._lock:
+            self._buffered -= nbytes
+
+    def _advance_clock(self, nbytes):
+        with self._lock:
+            now = time.monotonic()
+            if self._new_utterance:
+                self._new_utterance = False
+                self._utterance_start = max(now, self._clock_end)
+                self._utterance_bytes = 0
+            self._clock_end = max(now, self._clock_end) + nbytes / self.bytes_per_second
+            self._utterance_bytes += nbytes
+
+    def begin_utterance(self):
+        # until the first frame arrives nothing of this reply has played, whatever the last one did
+        with self._lock:
+            self._utterance_start = None
+            self._utterance_bytes = 0
+        self._muted = False
+        self.interrupted_ms = None
+
+    def feed(self, chunk):
+        if self._muted:         # frames still in flight from an interrupted turn
+            return
+        self._drained.clear()
+        with self._lock:
+            self._buffered += len(chunk)
+            buffered_ms = self._buffered * 1000 // self.bytes_per_second
+        if buffered_ms > self.stats["max_buffered_ms"]:
+            self.stats["max_buffered_ms"] = buffered_ms
+        self._queue.put(chunk)
+
+    async def feed_async(self, chunk, poll=0.02):
+        """feed() that first waits, without blocking the event loop, while the buffer is full."""
+        if self._buffered + len(chunk) > self.max_buffer_bytes and not self._muted:
+            self.stats["overruns"] += 1
+            while self._buffered + len(chunk) > self.max_buffer_bytes and self._buffered and not self._muted:
+                await asyncio.sleep(poll)
+        self.feed(chunk)
+
+    def end_utterance(self):
+        self._drained.clear()
+        self._queue.put(_END)
+
+    @property
+    def utterance_started_at(self):
+        """Monotonic time the current utterance's first frame reached the sink."""
+        return self._utterance_start
+
+    @property
+    def played_ms(self):
+        """Estimated audio of the current utterance that has left the speaker."""
+        with self._lock:
+            if self._utterance_start is None:
+                return 0
+            if not self.sink.realtime:
+                return self._utterance_bytes * 1000 // self.bytes_per_second
+            elapsed = time.monotonic() - self._utterance_start
+            total = self._utterance_bytes / self.bytes_per_second
+            return int(max(0.0, min(elapsed, total)) * 1000)
+
+    def wait_done(self, timeout=None):
+        if not self._drained.wait(timeout):
+            return False
+        if self.sink.realtime:
+            with self._lock:
+                remaining = self._clock_end - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+        return True
+
+    def interrupt(self):
+        """Stop playback now and drop frames until the next begin_utterance()."""
+        if not self._muted:
+            self.interrupted_ms = self.played_ms
+        self._muted = True
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            if isinstance(item, (bytes, bytearray)):
+                self._release(len(item))
+        self._queue.put(_DROP)      # the writer drops its pre-roll audio and aborts the sink
+        with self._lock:
+            self._clock_end = time.monotonic()
+        self._new_utterance = True
+        self._drained.set()
+
+    def report(self):
+        s = self.stats
+        return (f"[Audio] underruns {s['underruns']}, overruns {s['overruns']}, "
+                f"max buffered {s['max_buffered_ms']}ms (pre-roll {self.preroll_bytes * 1000 // self.bytes_per_second}ms, "
+                f"limit {self.max_buffer_bytes * 1000 // self.bytes_per_second}ms)")
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self.sink.close()
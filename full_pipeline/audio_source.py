@@ -0,0 +1,230 @@
+"""Audio inputs for ResumableMicrophoneStream.
+
+A source delivers 16-bit mono PCM through start(callback, on_end) / stop()
+and on_end() is called once if the input runs out. Live sources (a
+microphone, an unpaced pipe from a capture tool) must not be held up, so
+their callback never blocks and audio captured while the assistant speaks is
+skipped. For the others the callback blocks while the recognizer is a full
+ring buffer behind, so no recorded audio is lost however fast it is read.
+Files are paced in real time by default; speed=2 plays twice as fast,
+speed=0 as fast as they can be read.
+"""
+import os
+import stat
+import sys
+import threading
+import time
+import wave
+
+SILENCE_AFTER_END_MS = 3000     # keeps feeding silence after a file ends so the recognizer can finalize
+
+
+def find_respeaker_device():        # retunring respeaker device index
+    import pyaudio
+
+    p = pyaudio.PyAudio()
+    try:
+        for i in range(p.get_device_count()):
+            device_info = p.get_device_info_by_index(i)
+            if "respeaker" in device_info['name'].lower():
+                print(f"Found Respeaker: {device_info['name']}")
+                return i
+        # print("Respeaker not found, using default input device")
+        return None
+    except Exception as e:
+        print(f"Error finding Respeaker device: {e}")
+        return None
+    finally:
+        p.terminate()
+
+
+def read_wav_pcm(path, rate):
+    with wave.open(path, 'rb') as f:
+        if f.getsampwidth() != 2 or f.getnchannels() != 1 or f.getframerate() != rate:
+            raise ValueError(f"{path}: expected 16-bit mono {rate} Hz PCM")
+        return f.readframes(f.getnframes())
+
+
+class MicrophoneSource:
+    """PyAudio capture from device_index (None: the default input device)."""
+    live = True
+
+    def __init__(self, rate, chunk_size, device_index=None):
+        self.rate = rate
+        self.chunk_size = chunk_size
+        self.device_index = device_index
+        self._audio_interface = None
+        self._audio_stream = None
+
+    def start(self, callback, on_end=None):
+        import pyaudio
+
+        def fill_buffer(in_data, *args, **kwargs):
+            callback(in_data)
+            return None, pyaudio.paContinue
+
+        self._audio_interface = pyaudio.PyAudio()
+        self._audio_stream = self._audio_interface.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=self.rate,
+            input=True,
+            input_device_index=self.device_index,
+            frames_per_buffer=self.chunk_size,
+            stream_callback=fill_buffer,
+        )
+
+    def stop(self):
+        if self._audio_stream is not None:
+            self._audio_stream.stop_stream()
+            self._audio_stream.close()
+            self._audio_stream = None
+        if self._audio_interface is not None:
+            self._audio_interface.terminate()
+            self._audio_interface = None
+
+
+class PacedSource:
+    """Base for sources that read PCM themselves: a thread hands out chunk_ms pieces at `speed` x real time.
+
+    Subclasses implement read(nbytes), returning b"" at the end of input.
+    The source then sends silence_after_ms of silence (so an utterance at the
+    very end still gets its final result) and sets `finished`.
+    """
+    live = False
+
+    def __init__(self, rate=16000, chunk_ms=100, speed=1.0, silence_after_ms=SILENCE_AFTER_END_MS):
+        self.rate = rate
+        self.chunk_bytes = rate * 2 * chunk_ms // 1000
+        self.interval = chunk_ms / 1000 / speed if speed else 0.0
+        self.silence_after_ms = silence_after_ms
+        self.chunk_ms = chunk_ms
+        self.finished = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def read(self, nbytes):
+        raise NotImplementedError
+
+    def start(self, callback, on_end=None):
+        self._stop.clear()
+        self.finished.clear()
+        self._thread = threading.Thread(target=self._run, args=(callback, on_end), name=type(self).__name__,
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self, callback, on_end):
+        deadline = time.monotonic()
+        silence_left = self.silence_after_ms
+        while not self._stop.is_set():
+            chunk = self.read(self.chunk_bytes)
+            if not chunk:
+                if silence_left <= 0:
+                    self.finished.set()
+                    if on_end is not None:
+                        on_end()
+                    return
+                silence_left -= self.chunk_ms
+                chunk = bytes(self.chunk_bytes)
+            callback(chunk)
+            if self.interval:
+                deadline += self.interval
+                self._stop.wait(max(0.0, deadline - time.monotonic()))
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+
+
+class WavSource(PacedSource):
+    """Plays a 16-bit mono WAV file (at the recognizer's rate) once, or forever with loop=True."""
+
+    def __init__(self, path, rate=16000, chunk_ms=100, speed=1.0, loop=False, **kwargs):
+        super().__init__(rate, chunk_ms, speed, **kwargs)
+        self.pcm = read_wav_pcm(path, rate)
+        self.loop = loop
+        self._pos = 0
+
+    def read(self, nbytes):
+        if self._pos >= len(self.pcm) and self.loop:
+            self._pos = 0
+        chunk = self.pcm[self._pos:self._pos + nbytes]
+        self._pos += len(chunk)
+        return chunk
+
+
+class PcmPipeSource(PacedSource):
+    """Raw 16-bit mono PCM from a file, FIFO or "-" (stdin), e.g. `arecord -f S16_LE -r 16000 | main.py ...`.
+
+    Pipes default to speed=0 and count as live captures: they arrive in real
+    time already. Regular files default to real time. To play a recording
+    through a pipe without losing audio, give it a speed.
+    """
+
+    def __init__(self, path="-", rate=16000, chunk_ms=100, speed=None, **kwargs):
+        pipe = path == "-" or (os.path.exists(path) and stat.S_ISFIFO(os.stat(path).st_mode))
+        if speed is None:
+            speed = 0 if pipe else 1.0
+        super().__init__(rate, chunk_ms, speed, **kwargs)
+        self.live = pipe and not speed
+        self.path = path
+        self._file = None
+
+    def start(self, callback, on_end=None):
+        self._file = sys.stdin.buffer if self.path == "-" else open(self.path, 'rb')
+        super().start(callback, on_end)
+
+    def read(self, nbytes):
+        chunk = b""
+        while len(chunk) < nbytes:
+            data = self._file.read(nbytes - len(chunk))
+            if not data:
+                break
+            chunk += data
+        return chunk[:len(chunk) // 2 * 2]
+
+    def stop(self):
+        super().stop()
+        if self._file is not None and self._file is not sys.stdin.buffer:
+            self._file.close()
+        self._file = None
+
+
+class ScriptedSource(PacedSource):
+    """Microphone stand-in for benchmarks: silence until say() queues an utterance, paced like a real device."""
+    live = True
+
+    def __init__(self, rate=16000, chunk_ms=100, speed=1.0):
+        super().__init__(rate, chunk_ms, speed, silence_after_ms=0)
+        self._pending = b""
+        self._lock = threading.Lock()
+        self.spoken = threading.Event()
+
+    def say(self, pcm):
+        with self._lock:
+            self._pending += pcm
+        self.spoken.clear()
+
+    def read(self, nbytes):
+        with self._lock:
+            chunk, self._pending = self._pending[:nbytes], self._pending[nbytes:]
+            if chunk and not self._pending:
+                self.spoken.set()
+        return chunk.ljust(nbytes, b"\0")
+
+
+def create_source(spec, rate, chunk_size, speed=None):
+    """mic[:<device index>], wav:<path>, wav-loop:<path> or pcm:<path|->.
+
+    speed defaults to real time for WAV and PCM files and to unpaced for pipes.
+    """
+    kind, _, arg = spec.partition(":")
+    chunk_ms = chunk_size * 1000 // rate
+    if kind == "mic":
+        return MicrophoneSource(rate, chunk_size, int(arg) if arg else find_respeaker_device())
+    if kind in ("wav", "wav-loop"):
+        return WavSource(arg, rate, chunk_ms, 1.0 if speed is None else speed, loop=kind == "wav-loop")
+    if kind == "pcm":
+        return PcmPipeSource(arg or "-", rate, chunk_ms, speed)
+    raise ValueError(f"unknown audio source: {spec}")
@@ -1,43 +1,110 @@
-import json
 import os
 from datetime import datetime
 from typing import List, Dict
 
+from history_store import HistoryLog, migrate_json_history
+from token_counter import count_message_tokens
+
 
 class ConversationManager:
-    def __init__(self, history_file="conversation_history.json", max_history=40):
+    def __init__(self, history_file="conversation_history.json", max_history=40, token_budget=3000,
+                 rollover_keep=0.5):
         self.history_file = history_file
         self.max_history = max_history
+        self.token_budget = token_budget
+        self.rollover_keep = rollover_keep
+        self.rollovers = 0
+        # the API window is history[_anchor - _trimmed:]; it only moves on rollover (see get_messages_for_api)
+        self._anchor = 0
+        self._trimmed = 0
+        # history_file=None keeps the conversation in memory only (server sessions without --history-dir)
+        self.log_file = os.path.splitext(history_file)[0] + ".jsonl" if history_file else None
+        self.log = HistoryLog(self.log_file) if self.log_file else None
         self.conversation_history = self.load_history()
-    
+
     def load_history(self) -> List[Dict]:
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return []
-        return []
-    
-    def save_history(self):
+        if self.log is None:
+            return []
+        if self.history_file != self.log_file:
+            migrate_json_history(self.history_file, self.log_file)
         try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(self.conversation_history, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"대화 기록 저장 실패: {e}")
-    
+            return self.log.load_tail(self.max_history * 2)
+        except OSError:
+            return []
+
+    def save_history(self):
+        if self.log is not None:
+            self.log.flush()
+
     def add_message(self, role: str, content: str):
-        self.conversation_history.append({
+        record = {
             "role": role,
             "content": content,
-            "timestamp": datetime.now().isoformat()
-        })
-        self.save_history()
-    
-    def get_messages_for_api(self) -> List[Dict]:
-        return [{"role": msg["role"], "content": msg["content"]} 
-                for msg in self.conversation_history[-self.max_history * 2:]]
-    
+            "timestamp": datetime.now().isoformat(),
+            "tokens": count_message_tokens(content),
+        }
+        self.conversation_history.append(record)
+        excess = len(self.conversation_history) - self.max_history * 2
+        if excess > 0:
+            del self.conversation_history[:excess]
+            self._trimmed += excess
+        if self.log is not None:
+            self.log.append(record)
+
+    @staticmethod
+    def message_tokens(msg: Dict) -> int:
+        if "tokens" not in msg:             # records written before token counts were stored
+            msg["tokens"] = count_message_tokens(msg["content"])
+        return msg["tokens"]
+
+    def _window_tokens(self, start):
+        return sum(self.message_tokens(msg) for msg in self.conversation_history[start:])
+
+    def get_messages_for_api(self, reserved_tokens=0) -> List[Dict]:
+        """The anchored history window, within token_budget minus reserved_tokens (e.g. the system prompt).
+
+        The window only grows by appending, so consecutive requests share a
+        byte-identical prefix and the provider's prompt cache keeps hitting.
+        When it no longer fits (or its oldest message was trimmed), the anchor
+        rolls forward in one large step, keeping only the newest messages
+        that fill rollover_keep of the budget, and then stays put again.
+        A rollover always keeps the newest stored message, even one larger
+        than that share, and opens the window on a user message when it can.
+        The current query is not in the history yet: callers append it after
+        this window and count it in reserved_tokens.
+        """
+        history = self.conversation_history
+        start = self._anchor - self._trimmed
+        budget = None if self.token_budget is None else self.token_budget - reserved_tokens
+        if start < 0 or (budget is not None and self._window_tokens(start) > budget):
+            start = self._rollover_start(budget)
+            self._anchor = start + self._trimmed
+            self.rollovers += 1
+        return [{"role": msg["role"], "content": msg["content"]} for msg in history[start:]]
+
+    def _rollover_start(self, budget):
+        history = self.conversation_history
+        keep_messages = max(1, int(self.max_history * 2 * self.rollover_keep))
+        keep_tokens = None if budget is None else budget * self.rollover_keep
+        start = len(history)
+        while start > 0 and len(history) - start < keep_messages:
+            cost = self.message_tokens(history[start - 1])
+            if keep_tokens is not None and start < len(history) and cost > keep_tokens:
+                break
+            if keep_tokens is not None:
+                keep_tokens -= cost
+            start -= 1
+        # open the window on a user turn rather than a dangling assistant reply
+        while start < len(history) - 1 and history[start]["role"] != "user":
+            start += 1
+        return start
+
     def clear_history(self):
         self.conversation_history = []
-        self.save_history()
+        self._anchor = self._trimmed = 0
+        if self.log is not None:
+            self.log.clear()
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
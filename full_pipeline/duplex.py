@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+
+from speculative import normalize_transcript
+
+
+class SpokenTextTracker:
+    """Maps playback position back to the characters ElevenLabs has voiced.
+
+    stream-input sends per-chunk alignment (character start times relative
+    to that chunk); chunk durations come from the audio byte rate. If no
+    alignment arrives, the synthesized text is cut proportionally.
+    """
+
+    def __init__(self, bytes_per_ms):
+        self.bytes_per_ms = bytes_per_ms
+        self.audio_ms = 0.0
+        self._chars = []
+        self._text = []
+
+    def add_text(self, text):
+        self._text.append(text)
+
+    def add_audio(self, nbytes, alignment=None):
+        if alignment:
+            for char, start in zip(alignment.get("chars") or [], alignment.get("charStartTimesMs") or []):
+                self._chars.append((self.audio_ms + start, char))
+        self.audio_ms += nbytes / self.bytes_per_ms
+
+    def spoken_text(self, played_ms):
+        if self._chars:
+            return "".join(char for start, char in self._chars if start < played_ms).strip()
+        text = "".join(self._text)
+        if self.audio_ms <= 0:
+            return ""
+        return text[:int(len(text) * min(1.0, played_ms / self.audio_ms))].strip()
+
+
+class DuplexController:
+    """Runs assistant turns in the background so recognition keeps going while it speaks.
+
+    User speech during a turn (barge-in) silences the player immediately and
+    cancels the turn's task, which closes the OpenAI stream and the
+    ElevenLabs websocket. barge_in() waits at most cancel_timeout for that.
+    """
+
+    def __init__(self, runtime, player, run_turn, min_chars=2, cancel_timeout=0.5):
+        self.runtime = runtime
+        self.player = player
+        self.run_turn = run_turn
+        self.min_chars = min_chars
+        self.cancel_timeout = cancel_timeout
+        self._future = None
+        self._task = None
+        self._idle = threading.Event()
+        self._idle.set()
+        self.barge_ins = 0
+
+    @property
+    def speaking(self):
+        return not self._idle.is_set()
+
+    def submit(self, *args):
+        self.barge_in()     # a new query always supersedes the running turn
+        self._idle.clear()
+        self._future = self.runtime.submit(self._turn(*args))
+        self._future.add_done_callback(self._turn_done)
+
+    def _turn_done(self, future):
+        # a superseded turn may finish after the next one started; only the current turn marks idle
+        if self._future is future:
+            self._idle.set()
+
+    async def _turn(self, *args):
+        self._task = asyncio.current_task()
+        try:
+            await self.run_turn(*args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"쿼리 처리 실패: {e}")
+        finally:
+            if self._task is asyncio.current_task():
+                self._task = None
+
+    def on_user_speech(self, transcript):
+        if self.speaking and len(normalize_transcript(transcript)) >= self.min_chars:
+            self.barge_in()
+
+    def barge_in(self):
+        if not self.speaking:
+            return True
+        started = time.monotonic()
+        self.player.interrupt()
+        task = self._task
+        if task is not None:
+            # cancel the task itself so the future only completes once its cleanup has run
+            self.runtime.call_soon(task.cancel)
+        else:
+            self._future.cancel()
+        finished = self._idle.wait(self.cancel_timeout)
+        self.player.interrupt()
+        self.barge_ins += 1
+        print(f"\n[Barge-in] 응답 중단 ({(time.monotonic() - started) * 1000:.0f}ms)")
+        return finished
+
+    def wait(self, timeout=None):
+        return self._idle.wait(timeout)
@@ -0,0 +1,129 @@
+"""Compare local endpointing against Google's is_final on recorded WAV files.
+
+    python endpoint_eval.py samples/*.wav
+    python endpoint_eval.py --google samples/*.wav     # also stream each file to Google in real time
+
+Files must be 16-bit mono PCM. For every file the script reports when the
+last speech frame ends, when the local endpointer fires and, with --google,
+when the first is_final result arrives, all in ms of audio time.
+
+The live pipeline only fires once the interim transcript has been stable for
+--stability-ms, so its detector needs Google's interim results. Without
+--google only the VAD-only configuration (require_transcript=False) can be
+measured; it is a lower bound on the live lag. With --google the live
+configuration is replayed on the same stream and both are reported.
+"""
+import argparse
+import statistics
+import sys
+import time
+import wave
+
+from endpointing import Endpointer
+
+CHUNK_MS = 100
+
+
+def read_wav(path):
+    with wave.open(path, 'rb') as f:
+        if f.getsampwidth() != 2 or f.getnchannels() != 1:
+            raise ValueError(f"{path}: expected 16-bit mono PCM")
+        return f.getframerate(), f.readframes(f.getnframes())
+
+
+def chunks(pcm, rate, tail_silence_ms):
+    step = rate * 2 * CHUNK_MS // 1000
+    pcm = pcm + b"\0" * (rate * 2 * tail_silence_ms // 1000)
+    for i in range(0, len(pcm), step):
+        yield pcm[i:i + step]
+
+
+def create_endpointer(rate, args, require_transcript):
+    return Endpointer(rate, args.hangover_ms, args.stability_ms, min_speech_ms=args.min_speech_ms,
+                      mode=args.mode, require_transcript=require_transcript)
+
+
+def local_endpoint(pcm, rate, args):
+    endpointer = create_endpointer(rate, args, require_transcript=False)
+    for chunk in chunks(pcm, rate, args.tail_silence_ms):
+        if endpointer.feed(chunk):
+            break
+    return endpointer.speech_end_ms, endpointer.fired_ms
+
+
+def google_final(pcm, rate, args):
+    """(is_final ms, live endpointer ms): the live configuration is fed this stream's interim transcripts."""
+    from google.cloud import speech
+    from stt_google_cloud import create_speech_client
+
+    client = create_speech_client()
+    config = speech.StreamingRecognitionConfig(
+        config=speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=rate,
+            language_code="ko-KR",
+            enable_automatic_punctuation=True,
+        ),
+        interim_results=True,
+    )
+    endpointer = create_endpointer(rate, args, require_transcript=True)
+    started = time.monotonic()
+
+    def requests():
+        for chunk in chunks(pcm, rate, args.tail_silence_ms):
+            endpointer.feed(chunk)
+            yield speech.StreamingRecognizeRequest(audio_content=chunk)
+            time.sleep(CHUNK_MS / 1000)     # real-time pacing, as from a microphone
+
+    final = None
+    for response in client.streaming_recognize(config, requests()):
+        if not response.results or final is not None:
+            continue
+        result = response.results[0]
+        if result.is_final:
+            final = int((time.monotonic() - started) * 1000)
+        elif result.alternatives:
+            endpointer.observe_transcript(result.alternatives[0].transcript)
+    return final, endpointer.fired_ms
+
+
+def summarize(name, values):
+    values = [v for v in values if v is not None]
+    if values:
+        print(f"{name}: mean {statistics.mean(values):.0f}ms  median {statistics.median(values):.0f}ms  "
+              f"max {max(values)}ms  (n={len(values)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--mode', choices=['vad', 'energy'], default='vad')
+    parser.add_argument('--hangover-ms', type=int, default=700)
+    parser.add_argument('--stability-ms', type=int, default=300, help='Live configuration only (--google)')
+    parser.add_argument('--min-speech-ms', type=int, default=200)
+    parser.add_argument('--tail-silence-ms', type=int, default=2000, help='Silence appended after each file')
+    parser.add_argument('--google', action='store_true', help="Also measure Google's is_final latency")
+    args = parser.parse_args()
+
+    vad_lag, live_lag, google_lag = [], [], []
+    print("file\tspeech_end\tlocal_vad_only\tlocal_live\tgoogle_final")
+    for path in args.files:
+        rate, pcm = read_wav(path)
+        speech_end, fired = local_endpoint(pcm, rate, args)
+        final, live = google_final(pcm, rate, args) if args.google else (None, None)
+        print(f"{path}\t{speech_end}\t{fired}\t{live}\t{final}")
+        if speech_end is None:
+            continue
+        for lag, value in ((vad_lag, fired), (live_lag, live), (google_lag, final)):
+            if value is not None:
+                lag.append(value - speech_end)
+
+    summarize("local endpoint lag, VAD only (require_transcript=False)", vad_lag)
+    summarize("local endpoint lag, live config (require_transcript=True)", live_lag)
+    summarize("google is_final lag", google_lag)
+    if not args.google:
+        print("live config not measured: it needs interim transcripts, run with --google")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+import numpy as np
+import webrtcvad
+
+FRAME_MS = 30
+
+
+class Endpointer:
+    """Local end-of-utterance detector that runs on the captured PCM.
+
+    Fires once the user has spoken for at least min_speech_ms, has been
+    silent for hangover_ms, and (when require_transcript is set) the latest
+    interim transcript has not changed for stability_ms. All times are on
+    the audio clock, so the same code can be replayed against WAV files.
+    """
+
+    def __init__(self, sample_rate, hangover_ms=700, stability_ms=300, min_speech_ms=200,
+                 mode="vad", aggressiveness=2, energy_threshold=500, require_transcript=True):
+        if mode not in ("vad", "energy"):
+            raise ValueError(f"unknown endpointing mode: {mode}")
+        self.sample_rate = sample_rate
+        self.hangover_ms = hangover_ms
+        self.stability_ms = stability_ms
+        self.min_speech_ms = min_speech_ms
+        self.mode = mode
+        self.energy_threshold = energy_threshold
+        self.require_transcript = require_transcript
+        self._vad = webrtcvad.Vad(aggressiveness) if mode == "vad" else None
+        self.frame_bytes = sample_rate * 2 * FRAME_MS // 1000
+        self.reset()
+
+    def reset(self):
+        self._remainder = b""
+        self.audio_ms = 0
+        self.speech_ms = 0
+        self.silence_ms = 0
+        self.speech_end_ms = None
+        self.transcript = ""
+        self.transcript_changed_ms = 0
+        self.fired = False
+        self.fired_ms = None
+
+    def is_speech(self, frame):
+        if self._vad is not None:
+            return self._vad.is_speech(frame, self.sample_rate)
+        samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+        return float(np.sqrt(np.mean(samples * samples))) >= self.energy_threshold
+
+    def feed(self, data) -> bool:
+        """Consume captured PCM; returns True the first time the endpoint fires."""
+        if self._remainder:
+            data = self._remainder + data
+        usable = len(data) - len(data) % self.frame_bytes
+        self._remainder = data[usable:]
+
+        for offset in range(0, usable, self.frame_bytes):
+            self.audio_ms += FRAME_MS
+            if self.is_speech(data[offset:offset + self.frame_bytes]):
+                self.speech_ms += FRAME_MS
+                self.silence_ms = 0
+                self.speech_end_ms = self.audio_ms
+            else:
+                self.silence_ms += FRAME_MS
+
+        if not self.fired and self.should_end():
+            self.fired = True
+            self.fired_ms = self.audio_ms
+            return True
+        return False
+
+    def observe_transcript(self, transcript):
+        transcript = transcript.strip()
+        if transcript != self.transcript:
+            self.transcript = transcript
+            self.transcript_changed_ms = self.audio_ms
+
+    def should_end(self):
+        if self.speech_ms < self.min_speech_ms or self.silence_ms < self.hangover_ms:
+            return False
+        if not self.require_transcript:
+            return True
+        return bool(self.transcript) and self.audio_ms - self.transcript_changed_ms >= self.stability_ms
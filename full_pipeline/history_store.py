@@ -0,0 +1,143 @@
+import atexit
+import json
+import os
+import queue
+import threading
+from typing import List, Dict
+
+TAIL_BLOCK_SIZE = 64 * 1024
+
+_CLEAR = object()
+
+
+def read_tail_lines(path, n) -> List[bytes]:
+    """Return the last n non-empty lines of a file without reading all of it."""
+    if n <= 0 or not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        while pos > 0 and data.count(b"\n") <= n:
+            step = min(TAIL_BLOCK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = [line for line in data.split(b"\n") if line.strip()]
+    if pos > 0:
+        lines = lines[1:]       # first line may be cut in the middle
+    return lines[-n:]
+
+
+def parse_lines(lines) -> List[Dict]:
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue            # torn write from a crash
+    return records
+
+
+class HistoryLog:
+    """Append-only JSONL conversation log with a write-behind thread.
+
+    append() only enqueues; the writer thread batches whatever arrived within
+    flush_interval into a single write. Once the file grows past
+    compact_bytes it is rewritten (temp file + rename) with the newest
+    keep_records entries.
+    """
+
+    def __init__(self, path, flush_interval=0.5, compact_bytes=1024 * 1024, keep_records=400):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.compact_bytes = compact_bytes
+        self.keep_records = keep_records
+        self._queue = queue.Queue()
+        self._idle = threading.Condition()
+        self._pending = 0
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def load_tail(self, n) -> List[Dict]:
+        return parse_lines(read_tail_lines(self.path, n))
+
+    def append(self, record: Dict):
+        with self._idle:
+            self._pending += 1
+        self._queue.put(record)
+
+    def clear(self):
+        with self._idle:
+            self._pending += 1
+        self._queue.put(_CLEAR)
+
+    def flush(self, timeout=None):
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self):
+        atexit.unregister(self.close)      # a long-running server closes one log per session
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while True:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+            stop = None in batch
+            batch = [item for item in batch if item is not None]
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"대화 기록 저장 실패: {e}")
+            with self._idle:
+                self._pending -= len(batch)
+                self._idle.notify_all()
+            if stop:
+                return
+
+    def _write(self, batch):
+        if _CLEAR in batch:
+            batch = batch[len(batch) - batch[::-1].index(_CLEAR):]
+            open(self.path, 'w').close()
+        if not batch:
+            return
+        payload = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(payload)
+            size = f.tell()
+        if size > self.compact_bytes:
+            self.compact()
+
+    def compact(self):
+        lines = read_tail_lines(self.path, self.keep_records)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(b"".join(line + b"\n" for line in lines))
+        os.replace(tmp_path, self.path)
+
+
+def migrate_json_history(json_path, log_path):
+    """Convert a legacy conversation_history.json array into the JSONL log."""
+    if os.path.exists(log_path) or not os.path.exists(json_path):
+        return
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+    except (ValueError, OSError):
+        return
+    if not isinstance(records, list):
+        return
+    tmp_path = log_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, log_path)
+    os.replace(json_path, json_path + ".bak")
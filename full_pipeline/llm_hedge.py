@@ -0,0 +1,179 @@
+import asyncio
+import time
+
+
+class LlmStallError(Exception):
+    pass
+
+
+class LlmProvider:
+    """An OpenAI-compatible chat client (AsyncOpenAI or AsyncGroq) and the model to ask."""
+
+    def __init__(self, name, client, model, **options):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.options = options
+
+    async def open(self, messages, usage=None):
+        """Token iterator for one request; the final usage report, if the provider sends one, goes into `usage`."""
+        response = await self.client.chat.completions.create(
+            model=self.model, messages=messages, stream=True, **self.options)
+
+        async def tokens():
+            try:
+                async for chunk in response:
+                    # OpenAI sends usage in a last, choice-less chunk (stream_options); Groq puts it in x_groq
+                    report = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None)
+                    if report is not None and usage is not None:
+                        details = getattr(report, "prompt_tokens_details", None)
+                        usage["prompt_tokens"] = report.prompt_tokens
+                        usage["cached_tokens"] = getattr(details, "cached_tokens", None) or 0
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.content:
+                        yield delta.content
+            finally:
+                await response.close()      # a cancelled loser must not keep its HTTP connection busy
+
+        return tokens()
+
+
+class HedgedStream:
+    """Token stream raced between a primary and an optional secondary provider.
+
+    The primary starts at once. If it has no first token after hedge_ms (or
+    fails before one), the secondary is started too; whichever yields a
+    token first wins and the other is cancelled. No first token within
+    first_token_ms raises TimeoutError. After that, a gap longer than
+    stall_ms ends the stream early: what was already spoken stays, the turn
+    just stops instead of hanging.
+    """
+
+    def __init__(self, hedger, messages):
+        self.hedger = hedger
+        self.messages = messages
+        self.winner = None
+        self.stalled = False
+        self._started = time.monotonic()
+        self._tasks = {}
+        self._usage = {}
+        self._launch(hedger.primary)
+
+    def _launch(self, provider):
+        self._tasks[asyncio.ensure_future(self._first_token(provider))] = provider
+
+    @property
+    def usage(self):
+        """prompt_tokens / cached_tokens the winning provider reported (empty until the stream is done)."""
+        return self._usage.get(self.winner.name, {}) if self.winner is not None else {}
+
+    async def _first_token(self, provider):
+        tokens = await provider.open(self.messages, self._usage.setdefault(provider.name, {}))
+        try:
+            return tokens, await tokens.__anext__()
+        except StopAsyncIteration:
+            return tokens, None
+        except BaseException:
+            await tokens.aclose()
+            raise
+
+    async def aclose(self):
+        """Abandon a stream that has not been iterated: cancel its requests and close any opened response."""
+        tasks, self._tasks = list(self._tasks), {}
+        for task in tasks:
+            task.cancel()
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, tuple):
+                await result[0].aclose()
+
+    async def _race(self):
+        hedger = self.hedger
+        secondary_started = hedger.secondary is None
+        loop = asyncio.get_running_loop()
+        hedge_at = loop.time() + hedger.hedge_ms / 1000
+        give_up_at = loop.time() + hedger.first_token_ms / 1000
+        error = None
+        try:
+            while True:
+                if not self._tasks:
+                    if secondary_started:
+                        raise error
+                    secondary_started = True
+                    hedger.stats["failovers"] += 1
+                    self._launch(hedger.secondary)
+                    continue
+                wake_at = give_up_at if secondary_started else min(hedge_at, give_up_at)
+                done, _ = await asyncio.wait(self._tasks, timeout=max(0.0, wake_at - loop.time()),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if loop.time() >= give_up_at:
+                        raise TimeoutError(f"no LLM token within {hedger.first_token_ms}ms")
+                    secondary_started = True
+                    hedger.stats["hedges"] += 1
+                    self._launch(hedger.secondary)
+                    continue
+                for task in done:
+                    provider = self._tasks.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                        print(f"[LLM] {provider.name} 실패: {error}")
+                        continue
+                    if self.winner is None:
+                        self.winner = provider
+                        result = task.result()
+                    else:
+                        await task.result()[0].aclose()
+                if self.winner is not None:
+                    return result
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            self._tasks.clear()
+
+    async def __aiter__(self):
+        hedger = self.hedger
+        tokens, token = await self._race()
+        hedger.stats["wins"][self.winner.name] = hedger.stats["wins"].get(self.winner.name, 0) + 1
+        try:
+            while token is not None:
+                yield token
+                try:
+                    token = await asyncio.wait_for(tokens.__anext__(), hedger.stall_ms / 1000)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    self.stalled = True
+                    hedger.stats["stalls"] += 1
+                    print(f"\n[LLM] {self.winner.name} 응답이 {hedger.stall_ms}ms 동안 멈춰 턴을 종료합니다")
+                    break
+        finally:
+            await tokens.aclose()
+        usage = self.usage
+        if usage:
+            hedger.stats["prompt_tokens"] += usage["prompt_tokens"]
+            hedger.stats["cached_tokens"] += usage["cached_tokens"]
+
+
+class HedgedLlm:
+    def __init__(self, primary, secondary=None, hedge_ms=800, stall_ms=3000, first_token_ms=8000):
+        self.primary = primary
+        self.secondary = secondary
+        self.hedge_ms = hedge_ms
+        self.stall_ms = stall_ms
+        self.first_token_ms = first_token_ms
+        self.stats = {"hedges": 0, "failovers": 0, "stalls": 0, "wins": {}, "prompt_tokens": 0, "cached_tokens": 0}
+
+    def stream(self, messages):
+        """Start the request now; iterate the result for tokens. Must be called on the event loop."""
+        return HedgedStream(self, messages)
+
+    def report(self):
+        s = self.stats
+        wins = ", ".join(f"{name} {count}" for name, count in s["wins"].items()) or "-"
+        line = f"[LLM] wins: {wins}; hedges {s['hedges']}, failovers {s['failovers']}, stalls {s['stalls']}"
+        if s["prompt_tokens"]:
+            line += (f"; prompt cache {s['cached_tokens']}/{s['prompt_tokens']} tokens "
+                     f"({s['cached_tokens'] / s['prompt_tokens'] * 100:.0f}%)")
+        return line
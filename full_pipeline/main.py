@@ -2,13 +2,48 @@ import sys
 import os
 import argparse
 from dotenv import load_dotenv
-from stt_google_cloud import get_transcript
-from tts_gpt_elevenlabs import process_query
+from stt_google_cloud import StreamingRecognizer, SAMPLE_RATE, CHUNK_SIZE
+from audio_source import create_source
+from tts_gpt_elevenlabs import process_query, start_runtime, stop_runtime, on_interim, configure_llm, \
+    configure_response_cache
 import time
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--verbose', action='store_true', help='Enable verbose logging')
 parser.add_argument('--clear-history', action='store_true', help='Clear conversation history on start')
+parser.add_argument('--vad', action='store_true', help='Send only speech frames to Google STT')
+parser.add_argument('--vad-aggressiveness', type=int, default=2, choices=range(4), help='webrtcvad aggressiveness (0-3)')
+parser.add_argument('--vad-pre-roll-ms', type=int, default=300, help='Audio kept before detected speech')
+parser.add_argument('--vad-post-roll-ms', type=int, default=600, help='Audio kept after detected speech')
+parser.add_argument('--endpointing', choices=['off', 'finalize', 'interim'], default='off',
+                    help='Local end-of-utterance detection: force Google to finalize, or return the interim transcript')
+parser.add_argument('--endpoint-hangover-ms', type=int, default=700, help='Trailing silence before the endpoint fires')
+parser.add_argument('--endpoint-stability-ms', type=int, default=300, help='How long the interim transcript must stay unchanged')
+parser.add_argument('--speculative', action='store_true', help='Start the LLM on stable interim transcripts')
+parser.add_argument('--speculative-ms', type=int, default=400, help='How long an interim transcript must stay unchanged')
+parser.add_argument('--duplex', action='store_true', help='Keep listening while the assistant speaks and stop it on interruption')
+parser.add_argument('--trace', nargs='?', const='', metavar='JSONL',
+                    help='Record per-turn stage latencies (optionally to a JSONL file) and print p50/p95/p99 on exit')
+parser.add_argument('--hedge-ms', type=int, default=800,
+                    help='Also ask Groq if OpenAI has no first token after this long (needs GROQ_API_KEY)')
+parser.add_argument('--stall-ms', type=int, default=3000, help='End the reply if the LLM stream pauses this long')
+parser.add_argument('--no-fallback', action='store_true', help='Use OpenAI only')
+parser.add_argument('--response-cache', action='store_true', help='Replay earlier answers to repeated queries')
+parser.add_argument('--response-cache-ttl', type=int, default=3600, help='Seconds a cached answer stays valid')
+parser.add_argument('--semantic-cache', type=float, nargs='?', const=0.92, metavar='SIMILARITY',
+                    help='Also match paraphrases by embedding similarity (implies --response-cache)')
+parser.add_argument('--audio-source', default='mic',
+                    help="Input: mic[:<device index>], wav:<path>, wav-loop:<path> or pcm:<path|-> (raw 16 kHz s16le)")
+parser.add_argument('--source-speed', type=float, default=None,
+                    help='Pacing for file/pipe sources: 1 real time (default for files), 2 twice as fast, '
+                         '0 unpaced (default for pipes; runs ahead of the recognizer, so audio it has not '
+                         'finalized a ring buffer back is skipped)')
+parser.add_argument('--audio-sink', default='mpv', help="Playback backend: mpv, pyaudio (PCM only), null or file:<path>")
+parser.add_argument('--output-format', default='mp3_44100_128',
+                    choices=['mp3_44100_128', 'pcm_16000', 'pcm_22050', 'pcm_24000', 'pcm_44100'],
+                    help='ElevenLabs audio format; pcm_* plays without MP3 decoding')
+parser.add_argument('--preroll-ms', type=int, default=0, help='Audio buffered before playback starts or resumes after an underrun')
+parser.add_argument('--max-buffer-ms', type=int, default=8000, help='Audio queued ahead of playback before TTS reading pauses')
 args = parser.parse_args()
 
 def now():
@@ -31,11 +66,37 @@ if not os.getenv('ELEVENLABS_API_KEY'):
 
 if args.clear_history:
     from conversational_manager import ConversationManager
-    ConversationManager().clear_history()
+    manager = ConversationManager()
+    manager.clear_history()
+    manager.close()
     print("대화 기록을 초기화했습니다.")
     
 print("대화 시작... '종료' 또는 '끝'이라고 말하면 종료됩니다.")
 
+if args.trace is not None:
+    from tracing import tracer
+    tracer.enable(args.trace or None)
+
+configure_llm(args.hedge_ms, args.stall_ms, fallback=not args.no_fallback)
+if args.response_cache or args.semantic_cache is not None:
+    configure_response_cache(args.response_cache_ttl, semantic=args.semantic_cache is not None,
+                             similarity=args.semantic_cache or 0.92)
+start_runtime(args.audio_sink, args.speculative_ms if args.speculative else None, args.duplex, args.output_format,
+              args.preroll_ms, args.max_buffer_ms)
+vad_gate = None
+if args.vad:
+    from vad import VadGate
+    vad_gate = VadGate(SAMPLE_RATE, args.vad_aggressiveness, args.vad_pre_roll_ms, args.vad_post_roll_ms)
+endpointer = None
+if args.endpointing != 'off':
+    from endpointing import Endpointer
+    endpointer = Endpointer(SAMPLE_RATE, args.endpoint_hangover_ms, args.endpoint_stability_ms)
+source = None if args.audio_source == 'mic' else create_source(args.audio_source, SAMPLE_RATE, CHUNK_SIZE,
+                                                                args.source_speed)
+recognizer = StreamingRecognizer(args.verbose, vad=vad_gate, endpointer=endpointer, endpoint_mode=args.endpointing,
+                                 on_interim=on_interim if args.speculative or args.duplex else None,
+                                 full_duplex=args.duplex, source=source)
+
 try:
     while True:
         try:
@@ -43,7 +104,7 @@ try:
             if args.verbose:
                 print("음성 입력 대기 중...")
             
-            query = get_transcript(args.verbose)
+            query = recognizer.get_transcript()
             
             if query is None:
                 print("\n프로그램을 종료합니다.")
@@ -69,3 +130,9 @@ except KeyboardInterrupt:
     print("\n프로그램을 종료합니다.")
 except Exception as e:
     print(f"시스템 오류: {e}")
+finally:
+    recognizer.close()
+    stop_runtime()
+    if args.trace is not None:
+        print(tracer.summary())
+        tracer.close()
@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import re
+import time
+from collections import OrderedDict
+
+from speculative import normalize_transcript
+
+_WORDS = re.compile(r"\S+\s*")
+
+
+class CachedResponse:
+    __slots__ = ("key", "context", "query", "text", "created", "hits", "vector")
+
+    def __init__(self, key, context, query, text, vector=None):
+        self.key = key
+        self.context = context
+        self.query = query
+        self.text = text
+        self.created = time.monotonic()
+        self.hits = 0
+        self.vector = vector
+
+
+async def cached_tokens(text, delay=0.0):
+    """Replay a stored answer as word-sized tokens, so TextSegmenter and TTS see the same shape as live output."""
+    for token in _WORDS.findall(text):
+        yield token
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class OpenAiEmbedder:
+    def __init__(self, client, model="text-embedding-3-small"):
+        self.client = client
+        self.model = model
+
+    async def embed(self, text):
+        import numpy as np
+
+        response = await self.client.embeddings.create(model=self.model, input=text)
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+
+class VectorIndex:
+    """Brute-force cosine search over unit vectors; a few hundred cached answers need nothing fancier."""
+
+    def __init__(self):
+        self._vectors = {}
+        self._matrix = None
+        self._keys = []
+
+    def add(self, key, vector):
+        self._vectors[key] = vector
+        self._matrix = None
+
+    def remove(self, key):
+        if self._vectors.pop(key, None) is not None:
+            self._matrix = None
+
+    def search(self, vector, accept=None):
+        """(key, similarity) of the closest vector for which accept(key) holds, or (None, 0.0)."""
+        import numpy as np
+
+        if not self._vectors:
+            return None, 0.0
+        if self._matrix is None:
+            self._keys = list(self._vectors)
+            self._matrix = np.stack([self._vectors[key] for key in self._keys])
+        scores = self._matrix @ vector
+        for i in np.argsort(-scores):
+            key = self._keys[i]
+            if accept is None or accept(key):
+                return key, float(scores[i])
+        return None, 0.0
+
+
+class ResponseCache:
+    """Answers reused for repeated queries in the same short context.
+
+    The exact tier matches the normalized transcript plus a fingerprint of
+    the last context_messages history messages. With an embedder, misses
+    fall through to a similarity search over queries cached for the same
+    context, bounded by embed_timeout_ms so a slow embedding never costs
+    more than that. Entries expire after ttl_s and the least recently used
+    are evicted past max_entries.
+    """
+
+    def __init__(self, max_entries=500, ttl_s=3600, context_messages=2, embedder=None, similarity=0.92,
+                 embed_timeout_ms=200):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.context_messages = context_messages
+        self.embedder = embedder
+        self.similarity = similarity
+        self.embed_timeout_ms = embed_timeout_ms
+        self._entries = OrderedDict()
+        self._index = VectorIndex() if embedder is not None else None
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "expired": 0, "evicted": 0}
+
+    def context_key(self, history):
+        recent = history[-self.context_messages:] if self.context_messages else []
+        joined = "\x1f".join(f"{msg['role']}:{normalize_transcript(msg['content'])}" for msg in recent)
+        return hashlib.sha1(joined.encode("utf-8")).hexdigest()[:16]
+
+    def _key(self, context, query):
+        return f"{context}:{normalize_transcript(query)}"
+
+    def _alive(self, entry):
+        if time.monotonic() - entry.created <= self.ttl_s:
+            return True
+        self._drop(entry.key)
+        self.stats["expired"] += 1
+        return False
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        if self._index is not None:
+            self._index.remove(key)
+
+    async def lookup(self, query, history):
+        """Returns (entry or None, lookup state to pass to store())."""
+        entry, state = self.lookup_exact(query, history)
+        if entry is not None or self.embedder is None:
+            return entry, state
+        return await self.lookup_similar(query, state)
+
+    def lookup_exact(self, query, history):
+        """The exact tier alone; it never waits. A miss is only counted when there is no semantic tier to try."""
+        context = self.context_key(history)
+        key = self._key(context, query)
+        entry = self._entries.get(key)
+        if entry is not None and self._alive(entry):
+            return self._hit(entry, "exact_hits"), (context, None)
+        if self.embedder is None:
+            self.stats["misses"] += 1
+        return None, (context, None)
+
+    async def lookup_similar(self, query, state):
+        """The semantic tier, after an exact miss; callers can run it alongside the LLM request."""
+        context, _ = state
+        embedding = None
+        if self.embedder is not None:
+            embedding = asyncio.ensure_future(self.embedder.embed(normalize_transcript(query) or query))
+            try:
+                vector = await asyncio.wait_for(asyncio.shield(embedding), self.embed_timeout_ms / 1000)
+            except asyncio.TimeoutError:
+                vector = None       # keep computing it in the background for store()
+            except Exception as e:
+                print(f"[Cache] 임베딩 실패: {e}")
+                vector, embedding = None, None
+            if vector is not None:
+                match, score = self._index.search(
+                    vector, lambda k: self._entries[k].context == context and self._alive(self._entries[k]))
+                if match is not None and score >= self.similarity:
+                    return self._hit(self._entries[match], "semantic_hits"), (context, embedding)
+        self.stats["misses"] += 1
+        return None, (context, embedding)
+
+    def _hit(self, entry, kind):
+        entry.hits += 1
+        self._entries.move_to_end(entry.key)
+        self.stats[kind] += 1
+        return entry
+
+    async def store(self, query, text, state):
+        context, embedding = state
+        text = text.strip()
+        if not text:
+            return
+        vector = None
+        if embedding is not None:
+            try:
+                vector = await embedding
+            except Exception:
+                vector = None
+        key = self._key(context, query)
+        self._drop(key)
+        self._entries[key] = CachedResponse(key, context, query, text, vector)
+        if vector is not None:
+            self._index.add(key, vector)
+        self.stats["stores"] += 1
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.stats["evicted"] += 1
+
+    def clear(self):
+        for key in list(self._entries):
+            self._drop(key)
+
+    def report(self):
+        s = self.stats
+        hits = s["exact_hits"] + s["semantic_hits"]
+        lookups = hits + s["misses"]
+        rate = hits / lookups * 100 if lookups else 0.0
+        return (f"[Response cache] exact {s['exact_hits']}, semantic {s['semantic_hits']}, misses {s['misses']} "
+                f"(hit rate {rate:.0f}%), {len(self._entries)} entries, expired {s['expired']}, "
+                f"evicted {s['evicted']}")
@@ -0,0 +1,307 @@
+"""Voice conversation server: many concurrent callers in one process.
+
+    python server.py --port 8765
+    python server.py --port 8765 --history-dir sessions/ --max-sessions 300 --stt-channels 8
+
+Clients connect to ws://host:port/?voice=<voice_id>&session=<id> (both
+optional) and stream 16-bit mono 16 kHz PCM as binary frames. The server
+answers with JSON text frames
+
+    {"type": "session", "id": ...}
+    {"type": "transcript", "text": ..., "final": false|true}
+    {"type": "response_start", "text": <query>}
+    {"type": "response_end", "outcome": "ok"|"interrupted"|"error"}
+
+and the reply audio (mp3_44100_128) as binary frames between response_start
+and response_end. Speech during a reply interrupts it. {"type": "clear_history"}
+clears the session's history.
+
+Every session has its own recognition stream, ConversationManager and
+ElevenLabs websocket; the OpenAI HTTP pool, the gRPC channels to Google and
+the response cache (--response-cache) are shared by all sessions.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from urllib.parse import parse_qs, urlparse
+
+import websockets
+from google.cloud import speech
+
+from audio_player import MP3_44100_128_BPS
+from conversational_manager import ConversationManager
+from duplex import SpokenTextTracker
+from speculative import normalize_transcript
+from stt_google_cloud import MAX_REQUEST_BYTES, STREAMING_LIMIT, create_async_speech_client
+from tts_connection import WarmSocketPool
+import tts_gpt_elevenlabs
+from tts_gpt_elevenlabs import (CLEAR_HISTORY_COMMANDS, TTS_INIT_MESSAGE, TTS_MODEL_ID, VOICE_ID, aclient,
+                                configure_llm, configure_response_cache, now, respond, text_to_speech_input_streaming)
+
+SAMPLE_RATE = 16000
+AUDIO_QUEUE_CHUNKS = 200        # client frames buffered ahead of recognition; the oldest are dropped beyond that
+BARGE_IN_CHARS = 2
+
+
+def streaming_config():
+    return speech.StreamingRecognitionConfig(
+        config=speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=SAMPLE_RATE,
+            language_code="ko-KR",
+            max_alternatives=1,
+            enable_automatic_punctuation=True,
+        ),
+        interim_results=True,
+        single_utterance=False,
+    )
+
+
+class SpeechChannelPool:
+    """A few shared gRPC channels to Google; each recognition stream goes on the least loaded one.
+
+    One HTTP/2 connection multiplexes ~100 concurrent streams, so a handful
+    of channels covers hundreds of sessions.
+    """
+
+    def __init__(self, size):
+        self.clients = [create_async_speech_client() for _ in range(size)]
+        self.load = [0] * size
+
+    @contextlib.contextmanager
+    def lease(self):
+        i = min(range(len(self.clients)), key=self.load.__getitem__)
+        self.load[i] += 1
+        try:
+            yield self.clients[i]
+        finally:
+            self.load[i] -= 1
+
+    async def close(self):
+        for client in self.clients:
+            await client.transport.close()
+
+
+class Session:
+    def __init__(self, server, websocket, session_id, voice_id):
+        self.server = server
+        self.websocket = websocket
+        self.id = session_id
+        self.voice_id = voice_id
+        history_file = os.path.join(server.history_dir, f"{session_id}.json") if server.history_dir else None
+        self.manager = ConversationManager(history_file)
+        self.tts_pool = WarmSocketPool(voice_id, TTS_MODEL_ID, TTS_INIT_MESSAGE)
+        self.audio = asyncio.Queue(maxsize=AUDIO_QUEUE_CHUNKS)
+        self.turn = None
+        self.dropped_bytes = 0
+        self.turns = 0
+        self._audio_started = None      # when the current reply's first audio frame went out
+
+    async def run(self):
+        self.tts_pool.prewarm()
+        await self._send_json({"type": "session", "id": self.id})
+        tasks = [asyncio.ensure_future(self._receive()), asyncio.ensure_future(self._recognize())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    print(f"{now()} [Session {self.id}] 오류: {task.exception()}")
+        finally:
+            if self.turn is not None:
+                tasks.append(self.turn)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.tts_pool.close()
+            self.manager.close()
+
+    async def _send_json(self, payload):
+        with contextlib.suppress(websockets.ConnectionClosed):
+            await self.websocket.send(json.dumps(payload, ensure_ascii=False))
+
+    async def _receive(self):
+        async for message in self.websocket:
+            if isinstance(message, bytes):
+                self._enqueue(message)
+                continue
+            try:
+                command = json.loads(message)
+            except json.JSONDecodeError:
+                continue
+            if command.get("type") == "clear_history":
+                self.manager.clear_history()
+                await self._send_json({"type": "history_cleared"})
+
+    def _enqueue(self, chunk):
+        if self.audio.full():
+            # recognition fell behind (or Google is unreachable); keep the newest audio
+            self.dropped_bytes += len(self.audio.get_nowait())
+        self.audio.put_nowait(chunk)
+
+    async def _requests(self, deadline):
+        yield speech.StreamingRecognizeRequest(streaming_config=self.server.streaming_config)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return      # half-close; the loop in _recognize opens the next stream
+            try:
+                chunk = await asyncio.wait_for(self.audio.get(), remaining)
+            except asyncio.TimeoutError:
+                return
+            for i in range(0, len(chunk), MAX_REQUEST_BYTES):
+                yield speech.StreamingRecognizeRequest(audio_content=chunk[i:i + MAX_REQUEST_BYTES])
+
+    async def _recognize(self):
+        while True:
+            try:
+                with self.server.speech.lease() as client:
+                    responses = await client.streaming_recognize(
+                        requests=self._requests(time.monotonic() + STREAMING_LIMIT / 1000))
+                    async for response in responses:
+                        if not response.results or not response.results[0].alternatives:
+                            continue
+                        result = response.results[0]
+                        await self._on_result(result.alternatives[0].transcript, result.is_final)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"{now()} [Session {self.id}] 음성 인식 재시작: {e}")
+                await asyncio.sleep(0.5)
+
+    async def _on_result(self, transcript, is_final):
+        await self._send_json({"type": "transcript", "text": transcript, "final": is_final})
+        speaking = self.turn is not None and not self.turn.done()
+        if not is_final:
+            if speaking and len(normalize_transcript(transcript)) >= BARGE_IN_CHARS:
+                self.turn.cancel()
+            return
+        if speaking:
+            self.turn.cancel()
+        if not transcript.strip():
+            return
+        if transcript.strip().lower() in CLEAR_HISTORY_COMMANDS:
+            self.manager.clear_history()
+            await self._send_json({"type": "history_cleared"})
+            return
+        self.turn = asyncio.ensure_future(self._respond(transcript, self.turn))
+
+    async def _respond(self, query, previous):
+        if previous is not None and not previous.done():
+            # the interrupted turn records what was heard before this one adds the new query
+            await asyncio.wait({previous})
+        self.turns += 1
+        self._audio_started = None
+        await self._send_json({"type": "response_start", "text": query})
+        outcome = "error"
+        try:
+            await respond(query, self.manager, self._speak, SpokenTextTracker(MP3_44100_128_BPS / 1000),
+                          self._played_ms)
+            outcome = "ok"
+        except asyncio.CancelledError:
+            outcome = "interrupted"
+            raise
+        except Exception as e:
+            print(f"{now()} [Session {self.id}] 응답 생성 실패: {e}")
+        finally:
+            await self._send_json({"type": "response_end", "outcome": outcome})
+
+    async def _speak(self, text_iterator, tracker):
+        await text_to_speech_input_streaming(self.voice_id, text_iterator, tracker, pool=self.tts_pool,
+                                             audio_out=self._send_audio, echo=False)
+
+    async def _send_audio(self, audio_stream):
+        async for chunk in audio_stream:
+            if self._audio_started is None:
+                self._audio_started = time.monotonic()
+            with contextlib.suppress(websockets.ConnectionClosed):
+                await self.websocket.send(chunk)
+
+    def _played_ms(self):
+        # the client plays frames as they arrive, so wall time since the first one approximates what was heard
+        if self._audio_started is None:
+            return 0
+        return (time.monotonic() - self._audio_started) * 1000
+
+
+class ConversationServer:
+    def __init__(self, history_dir=None, max_sessions=200, stt_channels=4):
+        self.history_dir = history_dir
+        self.max_sessions = max_sessions
+        self.stt_channels = stt_channels
+        self.streaming_config = streaming_config()
+        self.sessions = {}
+        self.speech = None
+
+    async def serve(self, host, port):
+        if self.history_dir:
+            os.makedirs(self.history_dir, exist_ok=True)
+        self.speech = SpeechChannelPool(self.stt_channels)
+        try:
+            await aclient.models.retrieve('gpt-4o-mini')
+        except Exception as e:
+            print(f"OpenAI 연결 예열 실패: {e}")
+        try:
+            async with websockets.serve(self._handle, host, port, max_size=2 ** 20):
+                print(f"{now()} [Server] ws://{host}:{port} (최대 {self.max_sessions} 세션)")
+                await asyncio.Future()
+        finally:
+            await self.speech.close()
+            await aclient.close()
+            if tts_gpt_elevenlabs.response_cache is not None:
+                print(tts_gpt_elevenlabs.response_cache.report())
+
+    async def _handle(self, websocket, path=None):
+        if len(self.sessions) >= self.max_sessions:
+            await websocket.close(1013, "server full")
+            return
+        request_path = path or getattr(websocket, "path", None) or websocket.request.path
+        params = {key: values[-1] for key, values in parse_qs(urlparse(request_path).query).items()}
+        session_id = re.sub(r"[^\w-]", "", params.get("session", "")) or uuid.uuid4().hex[:12]
+        if session_id in self.sessions:
+            await websocket.close(1008, "session already connected")
+            return
+        session = Session(self, websocket, session_id, params.get("voice") or VOICE_ID)
+        self.sessions[session_id] = session
+        print(f"{now()} [Server] 세션 시작 {session_id} ({len(self.sessions)}개 활성)")
+        try:
+            await session.run()
+        finally:
+            del self.sessions[session_id]
+            print(f"{now()} [Server] 세션 종료 {session_id}: {session.turns}턴, "
+                  f"유실 오디오 {session.dropped_bytes} bytes ({len(self.sessions)}개 활성)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--history-dir', default=None, help='Persist each session history here (default: memory)')
+    parser.add_argument('--max-sessions', type=int, default=200)
+    parser.add_argument('--stt-channels', type=int, default=4, help='Shared gRPC channels to Google STT')
+    parser.add_argument('--response-cache', action='store_true', help='Replay earlier answers across sessions')
+    parser.add_argument('--response-cache-ttl', type=int, default=3600)
+    parser.add_argument('--semantic-cache', type=float, nargs='?', const=0.92, metavar='SIMILARITY')
+    parser.add_argument('--no-fallback', action='store_true', help='Use OpenAI only, never Groq')
+    args = parser.parse_args()
+
+    configure_llm(fallback=not args.no_fallback)
+
+    if args.response_cache or args.semantic_cache is not None:
+        configure_response_cache(args.response_cache_ttl, semantic=args.semantic_cache is not None,
+                                 similarity=args.semantic_cache or 0.92)
+
+    server = ConversationServer(args.history_dir, args.max_sessions, args.stt_channels)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n서버를 종료합니다.")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
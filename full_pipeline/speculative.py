@@ -0,0 +1,127 @@
+import asyncio
+import re
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize_transcript(text):
+    # punctuation and spacing differ between interim and final results without changing the query
+    return _NON_WORD.sub("", text).lower()
+
+
+class SpeculativeCompletion:
+    """An LLM stream started from an interim transcript. Tokens are buffered until the turn commits to it."""
+
+    def __init__(self, query, start_stream):
+        self.query = query
+        self.key = normalize_transcript(query)
+        self.tokens = []
+        self.finished = False
+        self.error = None
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump(start_stream))
+
+    async def _pump(self, start_stream):
+        try:
+            async for token in await start_stream(self.query):
+                self.tokens.append(token)
+                self._changed.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._changed.set()
+
+    async def stream(self):
+        i = 0
+        while True:
+            while i < len(self.tokens):
+                yield self.tokens[i]
+                i += 1
+            if self.finished:
+                break
+            self._changed.clear()
+            if i == len(self.tokens) and not self.finished:
+                await self._changed.wait()
+        if self.error is not None:
+            raise self.error
+
+    def cancel(self):
+        self.task.cancel()
+
+
+class Speculator:
+    """Starts chat completion once an interim transcript has been stable for stable_ms.
+
+    on_interim() may be called from any thread. take() runs on the runtime
+    loop when the final transcript arrives: it hands back the speculative
+    stream if the normalized texts match and cancels it otherwise.
+    """
+
+    def __init__(self, runtime, start_stream, stable_ms=400):
+        self.runtime = runtime
+        self.start_stream = start_stream
+        self.stable_ms = stable_ms
+        self.current = None
+        self._timer = None
+        self._pending_key = None
+        self.stats = {"started": 0, "hits": 0, "misses": 0, "restarts": 0, "unused": 0}
+
+    def on_interim(self, transcript):
+        self.runtime.call_soon(self._schedule, transcript)
+
+    def _schedule(self, transcript):
+        key = normalize_transcript(transcript)
+        if not key or key == self._pending_key:
+            return
+        self._pending_key = key
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.current is not None and self.current.key == key:
+            return
+        self._timer = asyncio.get_running_loop().call_later(self.stable_ms / 1000, self._launch, transcript)
+
+    def _launch(self, transcript):
+        self._timer = None
+        if self.current is not None:
+            self.current.cancel()
+            self.stats["restarts"] += 1
+        self.current = SpeculativeCompletion(transcript, self.start_stream)
+        self.stats["started"] += 1
+
+    async def take(self, final_transcript):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._pending_key = None
+        speculation, self.current = self.current, None
+        if speculation is None:
+            return None
+        if speculation.key == normalize_transcript(final_transcript) and speculation.error is None:
+            self.stats["hits"] += 1
+            return speculation
+        speculation.cancel()
+        self.stats["misses"] += 1
+        return None
+
+    def discard(self):
+        def _discard():
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._pending_key = None
+            if self.current is not None:
+                self.current.cancel()
+                self.current = None
+                self.stats["unused"] += 1
+        self.runtime.call_soon(_discard)
+
+    def report(self):
+        s = self.stats
+        decided = s["hits"] + s["misses"]
+        rate = s["hits"] / decided * 100 if decided else 0.0
+        return (f"[Speculative] started {s['started']}, hits {s['hits']}, misses {s['misses']}, "
+                f"restarts {s['restarts']}, unused {s['unused']} (hit rate {rate:.0f}%)")
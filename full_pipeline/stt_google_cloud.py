@@ -1,12 +1,15 @@
-import queue
 import re
 import sys
 import time
 import os
+import grpc
 from dotenv import load_dotenv
+from google.api_core import exceptions as api_exceptions
 from google.cloud import speech
-import pyaudio
-from collections import deque
+
+from audio_buffer import PcmRingBuffer
+from audio_source import MicrophoneSource, find_respeaker_device
+from tracing import tracer
 
 import time
 def now():
@@ -15,9 +18,11 @@ def now():
 load_dotenv()
 
 
-STREAMING_LIMIT = 240000
+STREAMING_LIMIT = 240000        # ms of audio per streaming_recognize session
 SAMPLE_RATE = 16000
 CHUNK_SIZE = int(SAMPLE_RATE / 10)
+RING_BUFFER_SECONDS = 30        # audio kept for bridging replay across session restarts
+MAX_REQUEST_BYTES = 25000       # streaming_recognize rejects larger audio_content messages
 
 RED = "\033[0;31m"      # ANSI escape code
 GREEN = "\033[0;32m"
@@ -26,242 +31,388 @@ YELLOW = "\033[0;33m"
 def get_current_time():
     return int(round(time.time() * 1000))
 
-def find_respeaker_device():        # retunring respeaker device index
-    p = pyaudio.PyAudio()
-    try:
-        for i in range(p.get_device_count()):
-            device_info = p.get_device_info_by_index(i)
-            if "respeaker" in device_info['name'].lower():
-                print(f"Found Respeaker: {device_info['name']}")
-                return i
-        # print("Respeaker not found, using default input device")
-        return None
-    except Exception as e:
-        print(f"Error finding Respeaker device: {e}")
-        return None
-    finally:
-        p.terminate()
+def create_speech_client():
+    # SPEECH_EMULATOR_HOST points the client at a local plaintext StreamingRecognize server (benchmarks)
+    emulator = os.getenv("SPEECH_EMULATOR_HOST")
+    if emulator:
+        from google.cloud.speech_v1.services.speech.transports import SpeechGrpcTransport
+        return speech.SpeechClient(transport=SpeechGrpcTransport(channel=grpc.insecure_channel(emulator)))
+    return speech.SpeechClient()
+
+def create_async_speech_client():
+    # asyncio counterpart of create_speech_client(); every call opens its own gRPC channel
+    emulator = os.getenv("SPEECH_EMULATOR_HOST")
+    if emulator:
+        from google.cloud.speech_v1.services.speech.transports import SpeechGrpcAsyncIOTransport
+        return speech.SpeechAsyncClient(
+            transport=SpeechGrpcAsyncIOTransport(channel=grpc.aio.insecure_channel(emulator)))
+    return speech.SpeechAsyncClient()
+
+def is_cancelled(error):
+    # SpeechClient re-raises grpc errors as google.api_core exceptions; a bare call raises grpc.RpcError
+    if isinstance(error, api_exceptions.Cancelled):
+        return True
+    return isinstance(error, grpc.Call) and error.code() == grpc.StatusCode.CANCELLED
 
 class ResumableMicrophoneStream:
-    def __init__(self, rate, chunk_size):
+    def __init__(self, rate, chunk_size, device_index=None, buffer_seconds=RING_BUFFER_SECONDS, vad=None,
+                 endpointer=None, endpoint_mode="finalize", on_interim=None, source=None):
         self._rate = rate
         self.chunk_size = chunk_size
         self._num_channels = 1
-        # self._buff = deque(maxlen=50)
-        self._buff = queue.Queue()
+        self._bytes_per_ms = rate * 2 // 1000
+        self._ring = PcmRingBuffer(rate * 2 * buffer_seconds)
+        self._reader = None
         self.closed = True
         self.start_time = get_current_time()
         self.restart_counter = 0
-        self.audio_input = []
-        self.last_audio_input = []
+        self.session_start_pos = 0
+        self.last_session_start_pos = None
+        self.last_session_end_pos = 0
+        self.overflow_bytes = 0
         self.result_end_time = 0
         self.is_final_end_time = 0
         self.final_request_end_time = 0
         self.bridging_offset = 0            # for the session limit (4 min. in google cloud stt)
         self.last_transcript_was_final = False
         self.new_stream = True
-        self.device_index = find_respeaker_device()
-        self._audio_interface = pyaudio.PyAudio()
-        self._audio_stream = self._audio_interface.open(
-            format=pyaudio.paInt16,
-            channels=self._num_channels,
-            rate=self._rate,
-            input=True,
-            input_device_index=self.device_index,
-            frames_per_buffer=self.chunk_size,
-            stream_callback=self._fill_buffer,
-        )
+        self.device_index = device_index
+        self.vad = vad
+        self.endpointer = endpointer
+        self.endpoint_mode = endpoint_mode      # "finalize": half-close the request, "interim": return the interim at once
+        self.endpoint_fired = False
+        self.last_interim = ""
+        self.on_interim = on_interim
+        self.call = None
+        # anything with start(callback)/stop() that delivers 16-bit PCM (see audio_source.py)
+        self._source = source or MicrophoneSource(rate, chunk_size, device_index)
+        self._live = getattr(self._source, "live", True)
 
     def __enter__(self):
         self.closed = False
+        self._source.start(self._ring.write if self._live else self._write_waiting, self._end_of_input)
         return self
 
+    def _read_pos(self):
+        # called under the ring lock: where the recognizer will read next
+        reader = self._reader
+        if reader is not None and not reader.closed:
+            return reader.pos
+        return self.last_session_end_pos
+
+    def _keep_pos(self):
+        # called under the ring lock: the oldest audio still needed. The next session replays from
+        # the last final result; a second of slack keeps a reader that has caught up from deadlocking.
+        reader = self._reader
+        if reader is not None and not reader.closed:
+            replay = self.session_start_pos + self.is_final_end_time * self._bytes_per_ms
+        else:
+            replay = self.last_session_start_pos if self.last_session_start_pos is not None else 0
+        pos = self._read_pos()
+        return max(min(pos, replay), pos - self._ring.capacity + self._rate * 2)
+
+    def _write_waiting(self, data):
+        # recorded input waits instead of overwriting audio the recognizer may still read
+        self._ring.wait_for_reader(self._keep_pos, self._ring.capacity - len(data))
+        self._ring.write(data)
+
+    def _end_of_input(self):
+        # a file or pipe source ran out: once the recognizer has read the rest the current
+        # session ends and get_transcript() returns None after it
+        if not self._live:
+            self._ring.wait_for_reader(self._read_pos)
+        self.closed = True
+        self._ring.close()
+
     def __exit__(self, type, value, traceback):
-        self._audio_stream.stop_stream()
-        self._audio_stream.close()
         self.closed = True
-        self._buff.put(None)
-        self._audio_interface.terminate()
+        self._ring.close()      # first, so a source waiting for the recognizer wakes up
+        self._source.stop()
+
+    def start_listening(self, keep_buffered=False):
+        # skip whatever the microphone captured while the assistant was speaking; recorded input keeps it
+        if keep_buffered or not self._live:
+            return
+        self.new_stream = False
+        self.last_session_start_pos = None
 
-    def _fill_buffer(self, in_data, *args, **kwargs):
-        self._buff.put(in_data)
-        return None, pyaudio.paContinue
+    def begin_session(self):
+        self.start_time = get_current_time()
+        self.is_final_end_time = 0
+        start_pos = self._ring.write_pos
+        if not self._live:
+            start_pos = max(self.last_session_end_pos, self._ring.oldest_pos)
+
+        if self.new_stream and self.last_session_start_pos is not None:
+            if self.bridging_offset < 0:
+                self.bridging_offset = 0
+            if self.bridging_offset > self.final_request_end_time:
+                self.bridging_offset = self.final_request_end_time
+
+            # replay what the previous session heard after its last final result
+            replay_pos = self.last_session_start_pos + self.final_request_end_time * self._bytes_per_ms
+            start_pos = min(max(replay_pos, self._ring.oldest_pos), self.last_session_end_pos)
+            self.bridging_offset = (self.last_session_end_pos - start_pos) // self._bytes_per_ms
+
+        self.new_stream = False
+        self.session_start_pos = start_pos
+        self._reader = self._ring.reader(start_pos)
+        if self.vad is not None:
+            self.vad.reset()
+        if self.endpointer is not None:
+            self.endpointer.reset()
+        self.endpoint_fired = False
+        self.last_interim = ""
+        self.call = None
+
+    def end_session(self):
+        # each streaming_recognize call has its own generator; closing the reader wakes
+        # the old one so it stops pulling audio
+        reader = self._reader
+        if reader is None:
+            return
+        reader.close()
+        self.overflow_bytes += reader.overflow_bytes
+        self.last_session_start_pos = self.session_start_pos
+        self.last_session_end_pos = reader.pos
+        self.result_end_time = 0
 
     def generator(self):
+        reader = self._reader
         while not self.closed:
-            data = []
-
-            if self.new_stream and self.last_audio_input:
-                chunk_time = STREAMING_LIMIT / len(self.last_audio_input)
-                if chunk_time != 0:
-                    if self.bridging_offset < 0:
-                        self.bridging_offset = 0
-                    if self.bridging_offset > self.final_request_end_time:
-                        self.bridging_offset = self.final_request_end_time
-
-                    chunks_from_ms = round((self.final_request_end_time - self.bridging_offset) / chunk_time)
-                    self.bridging_offset = round((len(self.last_audio_input) - chunks_from_ms) * chunk_time)
+            data = reader.read(MAX_REQUEST_BYTES)
+            if data is None:
+                return
+            if self.endpointer is not None and self.endpointer.feed(data):
+                self._on_endpoint()
+                return
+            if self.vad is not None:
+                data = self.vad.process(data)
+            if data:
+                yield data
+
+    def _on_endpoint(self):
+        # returning from the generator half-closes the request stream, which makes Google
+        # send its final result right away; in "interim" mode we do not wait for it
+        self.endpoint_fired = True
+        if self.endpoint_mode == "interim" and self.last_interim and self.call is not None:
+            self.call.cancel()
+
+    def observe_interim(self, transcript):
+        self.last_interim = transcript
+        if self.endpointer is not None:
+            self.endpointer.observe_transcript(transcript)
+        if self.on_interim is not None:
+            self.on_interim(transcript)
+
+    def mark_final(self):
+        if not tracer.enabled:
+            return
+        now_s = time.monotonic()
+        tracer.mark("stt_final", at=now_s)
+        # the ring's write position is "now"; speech ended wherever the recognizer (or endpointer) put it
+        end_ms = self.result_end_time
+        if self.endpointer is not None and self.endpointer.speech_end_ms is not None:
+            end_ms = self.endpointer.speech_end_ms
+        end_pos = self.session_start_pos + end_ms * self._bytes_per_ms
+        lag_ms = max(0, self._ring.write_pos - end_pos) / self._bytes_per_ms
+        tracer.mark("speech_end", at=now_s - lag_ms / 1000)
+
+    def session_time(self, recognizer_ms):
+        # result times count only the audio that was sent; map them back onto the captured audio
+        if self.vad is None:
+            return recognizer_ms
+        return self.vad.to_captured_ms(recognizer_ms)
+
+
+def is_exit_command(transcript):
+    return re.search(r"\b(exit|quit|종료|끝|대화끝)\b", transcript, re.I) is not None
 
-                    for i in range(chunks_from_ms, len(self.last_audio_input)):
-                        data.append(self.last_audio_input[i])
+def listen_print_loop(responses, stream, verbose=False):
+    final_transcript = ""
 
-                self.new_stream = False
+    try:
+        for response in responses:
+            if get_current_time() - stream.start_time > STREAMING_LIMIT:
+                stream.start_time = get_current_time()
+                break
 
-            chunk = self._buff.get()
-            self.audio_input.append(chunk)
+            if not response.results:
+                continue
 
-            if chunk is None:
-                return
+            result = response.results[0]
+            if not result.alternatives:
+                continue
 
-            data.append(chunk)
+            transcript = result.alternatives[0].transcript
 
-            while True:
-                try:
-                    chunk = self._buff.get(block=False)
-                    if chunk is None:
-                        return
-                    data.append(chunk)
-                    self.audio_input.append(chunk)
-                except queue.Empty:
-                    break
+            result_seconds = 0
+            result_micros = 0
 
-            yield b"".join(data)
+            if result.result_end_time.seconds:
+                result_seconds = result.result_end_time.seconds
 
-def listen_print_loop(responses, stream, verbose=False):
-    final_transcript = ""
-    
-    for response in responses:
-        if get_current_time() - stream.start_time > STREAMING_LIMIT:
-            stream.start_time = get_current_time()
-            break
+            if result.result_end_time.microseconds:
+                result_micros = result.result_end_time.microseconds
 
-        if not response.results:
-            continue
+            stream.result_end_time = stream.session_time(int((result_seconds * 1000) + (result_micros / 1000)))
 
-        result = response.results[0]
-        if not result.alternatives:
-            continue
+            corrected_time = (
+                stream.result_end_time
+                - stream.bridging_offset
+                + (STREAMING_LIMIT * stream.restart_counter)
+            )
 
-        transcript = result.alternatives[0].transcript
+            if result.is_final:
+                stream.mark_final()
+                print(f"{now()} [VAD] VAD done!")
+                if verbose:
+                    sys.stdout.write(GREEN)
+                    sys.stdout.write("\033[K")
+                    sys.stdout.write(str(corrected_time) + ": " + transcript + "\n")
+
+                stream.is_final_end_time = stream.result_end_time
+                stream.last_transcript_was_final = True
+
+                if is_exit_command(transcript):
+                    if verbose:
+                        sys.stdout.write(YELLOW)
+                        sys.stdout.write("Exiting...\n")
+                    stream.closed = True
+                    return None
 
-        result_seconds = 0
-        result_micros = 0
+                final_transcript = transcript
+                break
 
-        if result.result_end_time.seconds:
-            result_seconds = result.result_end_time.seconds
+            else:
+                if verbose:
+                    sys.stdout.write(RED)
+                    sys.stdout.write("\033[K")
+                    sys.stdout.write(str(corrected_time) + ": " + transcript + "\r")
+
+                stream.last_transcript_was_final = False
+                stream.observe_interim(transcript)
+
+    except (grpc.RpcError, api_exceptions.Cancelled) as e:
+        # the local endpointer cancels the call to return the interim transcript early
+        if not (stream.endpoint_fired and is_cancelled(e)):
+            raise
+
+    if not final_transcript and stream.endpoint_fired and stream.last_interim:
+        stream.mark_final()
+        print(f"{now()} [Endpoint] local endpoint")
+        stream.is_final_end_time = stream.result_end_time
+        if is_exit_command(stream.last_interim):
+            stream.closed = True
+            return None
+        final_transcript = stream.last_interim
 
-        if result.result_end_time.microseconds:
-            result_micros = result.result_end_time.microseconds
+    return final_transcript
 
-        stream.result_end_time = int((result_seconds * 1000) + (result_micros / 1000))
+class StreamingRecognizer:
+    """Long-lived recognizer: one gRPC channel and one open microphone stream for the whole conversation."""
+
+    def __init__(self, verbose=False, vad=None, endpointer=None, endpoint_mode="finalize", on_interim=None,
+                 full_duplex=False, source=None):
+        self.verbose = verbose
+        self.full_duplex = full_duplex      # keep listening while the assistant speaks
+        self.client = create_speech_client()
+        config = speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=SAMPLE_RATE,
+            language_code="ko-KR",
+            max_alternatives=1,
+            enable_automatic_punctuation=True,
+        )
 
-        corrected_time = (
-            stream.result_end_time
-            - stream.bridging_offset
-            + (STREAMING_LIMIT * stream.restart_counter)
+        self.streaming_config = speech.StreamingRecognitionConfig(
+            config=config,
+            interim_results=True,
+            single_utterance=False,
         )
 
-        if result.is_final:
-            print(f"{now()} [VAD] VAD done!")
-            if verbose:
-                sys.stdout.write(GREEN)
-                sys.stdout.write("\033[K")
-                sys.stdout.write(str(corrected_time) + ": " + transcript + "\n")
+        self.device_index = find_respeaker_device() if source is None else None
+        self.stream = ResumableMicrophoneStream(SAMPLE_RATE, CHUNK_SIZE, self.device_index, vad=vad,
+                                                 endpointer=endpointer, endpoint_mode=endpoint_mode,
+                                                 on_interim=on_interim, source=source).__enter__()
 
-            stream.is_final_end_time = stream.result_end_time
-            stream.last_transcript_was_final = True
+        if verbose:
+            print("음성 스트림 초기화 완료")
+            sys.stdout.write(YELLOW)
+            sys.stdout.write('\n한국어 음성 인식 중... "종료" 또는 "끝"이라고 말하면 종료됩니다.\n\n')
+            sys.stdout.write("End (ms) Transcript Results/Status\n")
+            sys.stdout.write("=====================================================\n")
 
-            if re.search(r"\b(exit|quit|종료|끝|대화끝)\b", transcript, re.I):
-                if verbose:
-                    sys.stdout.write(YELLOW)
-                    sys.stdout.write("Exiting...\n")
-                stream.closed = True
-                return None
+    def _session(self):
+        stream = self.stream
+        verbose = self.verbose
+        if verbose:
+            sys.stdout.write(YELLOW)
+            sys.stdout.write("\n" + str(STREAMING_LIMIT * stream.restart_counter) + ": NEW REQUEST\n")
 
-            final_transcript = transcript
-            break
+        stream.begin_session()
+        audio_generator = stream.generator()
 
-        else:
-            if verbose:
-                sys.stdout.write(RED)
-                sys.stdout.write("\033[K")
-                sys.stdout.write(str(corrected_time) + ": " + transcript + "\r")
-            
-            stream.last_transcript_was_final = False
+        requests = (speech.StreamingRecognizeRequest(audio_content=content) for content in audio_generator)
 
-    return final_transcript
+        responses = self.client.streaming_recognize(self.streaming_config, requests)
+        stream.call = responses
+        if stream.endpoint_fired and stream.endpoint_mode == "interim" and stream.last_interim:
+            responses.cancel()
 
-def get_transcript(verbose=False):
-    if not os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
-        print("Error: GOOGLE_APPLICATION_CREDENTIALS not found in .env file")
-        return None
+        if verbose:
+            print("스트리밍 인식 요청 전송")
 
-    client = speech.SpeechClient()
-    config = speech.RecognitionConfig(
-        encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-        sample_rate_hertz=SAMPLE_RATE,
-        language_code="ko-KR",
-        max_alternatives=1,
-        enable_automatic_punctuation=True,
-    )
-
-    streaming_config = speech.StreamingRecognitionConfig(
-        config=config,
-        interim_results=True,
-        single_utterance=False,
-    )
-
-    mic_manager = ResumableMicrophoneStream(SAMPLE_RATE, CHUNK_SIZE)
-
-    if verbose:
-        print("음성 스트림 초기화 완료")
-        sys.stdout.write(YELLOW)
-        sys.stdout.write('\n한국어 음성 인식 중... "종료" 또는 "끝"이라고 말하면 종료됩니다.\n\n')
-        sys.stdout.write("End (ms) Transcript Results/Status\n")
-        sys.stdout.write("=====================================================\n")
+        try:
+            transcript = listen_print_loop(responses, stream, verbose)
 
-    try:
-        with mic_manager as stream:
-            while not stream.closed:
-                if verbose:
-                    sys.stdout.write(YELLOW)
-                    sys.stdout.write("\n" + str(STREAMING_LIMIT * stream.restart_counter) + ": NEW REQUEST\n")
+            if verbose and stream._reader.overflow_bytes:
+                print(f"오디오 버퍼 초과: {stream._reader.overflow_bytes} bytes 유실")
+            if verbose and stream.vad is not None:
+                print(f"VAD: 전송 {stream.vad.forwarded_ms}ms / 생략 {stream.vad.dropped_ms}ms")
+
+            if transcript is None:
+                return None
 
-                stream.audio_input = []
-                audio_generator = stream.generator()
+            if stream.result_end_time > 0:
+                stream.final_request_end_time = stream.is_final_end_time
 
-                requests = (speech.StreamingRecognizeRequest(audio_content=content) for content in audio_generator)
+            stream.restart_counter = stream.restart_counter + 1
 
-                responses = client.streaming_recognize(streaming_config, requests)
+            if not stream.last_transcript_was_final:
+                sys.stdout.write("\n")
 
-                if verbose:
-                    print("스트리밍 인식 요청 전송")
+            stream.new_stream = True
+            return transcript
+        finally:
+            responses.cancel()
+            stream.end_session()
 
-                transcript = listen_print_loop(responses, stream, verbose)
+    def get_transcript(self):
+        """Block until the next utterance; returns None when the user asked to quit."""
+        stream = self.stream
+        stream.start_listening(keep_buffered=self.full_duplex)
+        tracer.begin_turn()
+        try:
+            while not stream.closed:
+                transcript = self._session()
 
                 if transcript is None:
                     return None
 
                 if transcript.strip():
-                    if stream.result_end_time > 0:
-                        stream.final_request_end_time = stream.is_final_end_time
-
-                    stream.result_end_time = 0
-                    stream.last_audio_input = stream.audio_input
-                    stream.audio_input = []
-                    stream.restart_counter = stream.restart_counter + 1
-
-                    if not stream.last_transcript_was_final:
-                        sys.stdout.write("\n")
-
-                    stream.new_stream = True
                     return transcript
 
-    except KeyboardInterrupt:
-        print("\n\n인식을 중단합니다...")
-        return None
-    except Exception as e:
-        print(f"오류가 발생했습니다: {e}")
+        except KeyboardInterrupt:
+            print("\n\n인식을 중단합니다...")
+            return None
+        except Exception as e:
+            print(f"오류가 발생했습니다: {e}")
+            return None
+
         return None
 
-    return None
+    def close(self):
+        if self.stream is not None:
+            self.stream.__exit__(None, None, None)
+            self.stream = None
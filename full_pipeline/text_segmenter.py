@@ -0,0 +1,161 @@
+import asyncio
+import time
+
+SENTENCE_ENDS = ".?!…~"
+CLAUSE_MARKS = ",;:"
+# connective endings that close a Korean clause when followed by a space (…하고, …해서, …지만, …는데)
+CLAUSE_ENDINGS = ("고", "서", "며", "면", "지만", "는데", "은데", "니까", "도록", "거나")
+STRONG, WEAK, SPACE = 3, 2, 1
+
+
+class TextSegmenter:
+    """Groups streamed LLM tokens into TTS chunks at Korean sentence and clause boundaries.
+
+    The first chunk is cut as soon as it reaches first_min_chars at any
+    boundary so audio can start early. Later chunks wait for a sentence end
+    past min_chars, settle for a clause boundary past the midpoint of
+    min/max, and are forced at the last space once max_chars is reached.
+    Text that sits in the buffer longer than flush_ms (later_flush_ms once
+    audio is already playing) is sent anyway, up to its last boundary.
+    Tokens are kept as a list and only joined when a chunk is emitted.
+    """
+
+    def __init__(self, first_min_chars=8, first_max_chars=30, min_chars=40, max_chars=150, flush_ms=400,
+                 later_flush_ms=1500):
+        self.first_min_chars = first_min_chars
+        self.first_max_chars = first_max_chars
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.flush_ms = flush_ms
+        self.later_flush_ms = later_flush_ms
+        self.chunks_sent = 0
+        self._parts = []
+        self._length = 0
+        self._boundary = {}         # buffer offset -> strongest boundary kind ending there
+        self._pending_end = None    # sentence mark at the end of a token, confirmed by what follows
+        self._tail = ""
+        self._since = None
+
+    def _mark(self, offset, kind):
+        if self._boundary.get(offset, 0) < kind:
+            self._boundary[offset] = kind
+
+    def feed(self, token):
+        if not token:
+            return []
+        if self._since is None:
+            self._since = time.monotonic()
+        start = self._length
+        self._parts.append(token)
+        self._length += len(token)
+
+        tail = self._tail
+        for i, ch in enumerate(token):
+            offset = start + i
+            if self._pending_end is not None:
+                if ch.isspace():
+                    self._mark(self._pending_end, STRONG)
+                self._pending_end = None
+            if ch in SENTENCE_ENDS:
+                self._pending_end = offset + 1
+            elif ch in CLAUSE_MARKS:
+                self._mark(offset + 1, WEAK)
+            elif ch.isspace() and offset > 0:
+                self._mark(offset, WEAK if tail.endswith(CLAUSE_ENDINGS) else SPACE)
+            tail = (tail + ch)[-3:]
+        self._tail = tail
+
+        return self._emit_ready()
+
+    def _choose_cut(self):
+        boundaries = sorted(self._boundary.items())
+        first = self.chunks_sent == 0
+        if first:
+            low, limit = self.first_min_chars, self.first_max_chars
+        else:
+            for offset, kind in boundaries:
+                if kind == STRONG and offset >= self.min_chars:
+                    return offset
+            low, limit = (self.min_chars + self.max_chars) // 2, self.max_chars
+
+        clauses = [offset for offset, kind in boundaries if kind >= WEAK and offset >= low]
+        if clauses:
+            return clauses[0] if first else clauses[-1]
+        if self._length >= limit:
+            fitting = [offset for offset, _ in boundaries if offset <= limit]
+            return fitting[-1] if fitting else limit
+        return None
+
+    def _emit_ready(self):
+        chunks = []
+        cut = self._choose_cut()
+        while cut is not None:
+            chunks.append(self._cut(cut))
+            cut = self._choose_cut()
+        return chunks
+
+    def _cut(self, offset):
+        text = "".join(self._parts)
+        chunk, rest = text[:offset], text[offset:]
+        self._parts = [rest] if rest else []
+        self._length = len(rest)
+        self._boundary = {o - offset: k for o, k in self._boundary.items() if o > offset}
+        if self._pending_end is not None:
+            self._pending_end = self._pending_end - offset if self._pending_end > offset else None
+        self._since = time.monotonic() if rest else None
+        self.chunks_sent += 1
+        return chunk.strip() + " "
+
+    def time_left(self):
+        """Seconds until the buffered text is due for a time-based flush, or None if empty."""
+        if self._since is None:
+            return None
+        interval = self.flush_ms if self.chunks_sent == 0 else self.later_flush_ms
+        return max(0.0, self._since + interval / 1000 - time.monotonic())
+
+    def flush(self):
+        """Send what is buffered, up to the last boundary if there is one."""
+        if not self._parts:
+            return []
+        if self._pending_end is not None:
+            self._mark(self._pending_end, STRONG)
+            self._pending_end = None
+        if not self._boundary:
+            # never cut inside a word; check again after another flush interval
+            self._since = time.monotonic()
+            return []
+        return [self._cut(max(self._boundary))]
+
+    def finish(self):
+        text = "".join(self._parts).strip()
+        self._parts, self._length, self._boundary = [], 0, {}
+        self._pending_end, self._since = None, None
+        if text:
+            self.chunks_sent += 1
+            return [text + " "]
+        return []
+
+    async def segment(self, tokens):
+        iterator = tokens.__aiter__()
+        pending = None
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                done, _ = await asyncio.wait({pending}, timeout=self.time_left())
+                if not done:
+                    for chunk in self.flush():
+                        yield chunk
+                    continue
+                task, pending = pending, None
+                try:
+                    token = task.result()
+                except StopAsyncIteration:
+                    break
+                for chunk in self.feed(token):
+                    yield chunk
+            for chunk in self.finish():
+                yield chunk
+        finally:
+            if pending is not None:
+                pending.cancel()
@@ -0,0 +1,37 @@
+import math
+
+try:
+    import tiktoken
+except ImportError:         # optional: fall back to a character heuristic
+    tiktoken = None
+
+MESSAGE_OVERHEAD = 4        # role and separator tokens the chat format adds per message
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("o200k_base")     # gpt-4o / gpt-4o-mini
+        except Exception:
+            _encoding = False
+    return _encoding or None
+
+
+def estimate_tokens(text: str) -> int:
+    # o200k spends roughly one token per Hangul syllable and ~4 characters per token elsewhere
+    hangul = sum(1 for ch in text if '가' <= ch <= '힣')
+    return hangul + math.ceil((len(text) - hangul) / 4)
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(content: str) -> int:
+    return count_tokens(content) + MESSAGE_OVERHEAD
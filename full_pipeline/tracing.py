@@ -0,0 +1,131 @@
+import contextvars
+import json
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+
+STAGES = (
+    "speech_end",
+    "stt_final",
+    "llm_request",
+    "llm_first_token",
+    "tts_first_chunk",
+    "tts_first_audio",
+    "playback_start",
+    "playback_end",
+)
+
+_active_turn = contextvars.ContextVar("active_turn", default=None)
+
+
+class Turn:
+    __slots__ = ("index", "marks", "attrs")
+
+    def __init__(self, index):
+        self.index = index
+        self.marks = {}
+        self.attrs = {}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    rank = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+class Tracer:
+    """Per-turn stage timestamps on the monotonic clock.
+
+    Stages are offsets in ms from speech_end (or the earliest mark if the
+    end of speech was not seen). Finished turns go to a JSONL file and into
+    rolling windows for the p50/p95/p99 summary. While disabled, mark() is
+    a single attribute check.
+    """
+
+    def __init__(self, window=500):
+        self.enabled = False
+        self.current = None
+        self._window = window
+        self._file = None
+        self._lock = threading.Lock()
+        self._count = 0
+        self._samples = defaultdict(lambda: deque(maxlen=self._window))
+
+    def enable(self, path=None):
+        self.enabled = True
+        if path:
+            self._file = open(path, 'a', encoding='utf-8')
+
+    def begin_turn(self):
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._count += 1
+            self.current = Turn(self._count)
+        return self.current
+
+    def activate(self, turn):
+        # asyncio tasks copy the context, so marks made inside a turn's task stay with that turn
+        if turn is not None:
+            _active_turn.set(turn)
+
+    def mark(self, stage, at=None, **attrs):
+        if not self.enabled:
+            return
+        turn = _active_turn.get() or self.current
+        if turn is None:
+            return
+        turn.marks.setdefault(stage, time.monotonic() if at is None else at)
+        if attrs:
+            turn.attrs.update(attrs)
+
+    def end_turn(self, turn=None, **attrs):
+        if not self.enabled:
+            return None
+        turn = turn or _active_turn.get() or self.current
+        if turn is None or not turn.marks:
+            return None
+        turn.attrs.update(attrs)
+        origin = turn.marks.get("speech_end", min(turn.marks.values()))
+        stages = {stage: round((at - origin) * 1000, 1)
+                  for stage, at in sorted(turn.marks.items(), key=lambda item: item[1])}
+        record = {
+            "turn": turn.index,
+            "time": datetime.now().isoformat(),
+            "origin": "speech_end" if "speech_end" in turn.marks else "first_mark",
+            "stages_ms": stages,
+            **turn.attrs,
+        }
+        with self._lock:
+            for stage, offset in stages.items():
+                self._samples[stage].append(offset)
+            if self._file is not None:
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._file.flush()
+        return record
+
+    def summary(self):
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+        if not samples:
+            return "[Trace] no turns recorded"
+        lines = [f"[Trace] {self._count} turns, ms from speech_end (rolling window {self._window})",
+                 f"{'stage':<18}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}"]
+        known = [stage for stage in STAGES if stage in samples]
+        others = sorted(stage for stage in samples if stage not in STAGES)
+        for stage in known + others:
+            values = samples[stage]
+            lines.append(f"{stage:<18}{len(values):>6}{percentile(values, 50):>10.0f}"
+                         f"{percentile(values, 95):>10.0f}{percentile(values, 99):>10.0f}")
+        return "\n".join(lines)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+tracer = Tracer()
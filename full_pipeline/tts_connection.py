@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+import time
+import websockets
+
+ELEVENLABS_WS_BASE = os.getenv("ELEVENLABS_WS_BASE", "wss://api.elevenlabs.io/v1/text-to-speech")
+MAX_INACTIVITY_TIMEOUT = 180    # seconds, upper bound accepted by the stream-input endpoint
+REFRESH_MARGIN = 10             # replace the warm socket this many seconds before the server drops it
+
+
+def is_open(websocket):
+    return websocket is not None and websocket.close_code is None
+
+
+class WarmSocketPool:
+    """Keeps one authenticated stream-input websocket open for the next turn.
+
+    stream-input sockets are single use (the server closes them after the
+    end-of-stream message), so after every acquire() a replacement is opened
+    in the background. The BOS message with voice settings and the API key is
+    sent up front, which moves the TLS handshake and auth out of the turn.
+    """
+
+    def __init__(self, voice_id, model_id, init_message, inactivity_timeout=MAX_INACTIVITY_TIMEOUT,
+                 output_format=None):
+        self.voice_id = voice_id
+        self.model_id = model_id
+        self.init_message = init_message
+        self.output_format = output_format      # None: the endpoint default, mp3_44100_128
+        self.inactivity_timeout = min(inactivity_timeout, MAX_INACTIVITY_TIMEOUT)
+        self._websocket = None
+        self._opened_at = 0.0
+        self._pending = None
+        self._keeper = None
+        self.reconnects = 0
+
+    def uri(self, voice_id=None):
+        uri = (f"{ELEVENLABS_WS_BASE}/{voice_id or self.voice_id}/stream-input"
+               f"?model_id={self.model_id}&inactivity_timeout={self.inactivity_timeout}&sync_alignment=true")
+        if self.output_format:
+            uri += f"&output_format={self.output_format}"
+        return uri
+
+    async def connect(self, voice_id=None):
+        websocket = await websockets.connect(self.uri(voice_id))
+        await websocket.send(json.dumps(self.init_message))
+        return websocket
+
+    def _fresh(self):
+        age = time.monotonic() - self._opened_at
+        return is_open(self._websocket) and age < self.inactivity_timeout - REFRESH_MARGIN
+
+    async def _open_warm(self):
+        websocket = await self.connect()
+        self._websocket, self._opened_at = websocket, time.monotonic()
+        return websocket
+
+    def prewarm(self):
+        if self._pending is None or self._pending.done():
+            self._pending = asyncio.ensure_future(self._open_warm())
+            self._pending.add_done_callback(self._report_failure)
+        if self._keeper is None or self._keeper.done():
+            self._keeper = asyncio.ensure_future(self._keep_fresh())
+        return self._pending
+
+    @staticmethod
+    def _report_failure(task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"TTS 웹소켓 사전 연결 실패: {task.exception()}")
+
+    async def acquire(self, voice_id=None):
+        if voice_id and voice_id != self.voice_id:
+            return await self.connect(voice_id)
+
+        if self._pending is not None and not self._pending.done():
+            try:
+                await self._pending
+            except Exception:
+                pass
+
+        if self._fresh():
+            websocket = self._websocket
+        else:
+            await self._discard()
+            websocket = await self.connect()
+            self.reconnects += 1
+
+        self._websocket = None
+        self.prewarm()
+        return websocket
+
+    async def _discard(self):
+        websocket, self._websocket = self._websocket, None
+        if websocket is not None:
+            try:
+                await websocket.close()
+            except Exception:
+                pass
+
+    async def _keep_fresh(self):
+        while True:
+            if self._websocket is None:
+                await asyncio.sleep(1)
+                continue
+            remaining = self._opened_at + self.inactivity_timeout - REFRESH_MARGIN - time.monotonic()
+            if remaining > 0:
+                await asyncio.sleep(min(remaining, 1))
+                continue
+            if self._pending is not None and not self._pending.done():
+                await asyncio.sleep(1)
+                continue
+            await self._discard()
+            self.reconnects += 1
+            try:
+                await self.prewarm()
+            except Exception as e:
+                print(f"TTS 웹소켓 재연결 실패: {e}")
+                await asyncio.sleep(5)
+
+    async def close(self):
+        for task in (self._keeper, self._pending):
+            if task is not None and not task.done():
+                task.cancel()
+        await self._discard()
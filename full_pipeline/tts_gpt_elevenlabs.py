@@ -2,12 +2,12 @@ import asyncio
 import websockets
 import json
 import base64
-import shutil
 import os
-import subprocess
-from openai import AsyncOpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
 from groq import AsyncGroq
+import groq
 
 import time
 def now():
@@ -16,6 +16,16 @@ def now():
 
 # from files
 from conversational_manager import ConversationManager
+from async_runtime import AsyncRuntime
+from tts_connection import WarmSocketPool
+from audio_player import DEFAULT_OUTPUT_FORMAT, AudioPlayer, bytes_per_second, create_sink
+from token_counter import count_message_tokens
+from speculative import Speculator
+from duplex import DuplexController, SpokenTextTracker
+from text_segmenter import TextSegmenter
+from tracing import tracer
+from llm_hedge import HedgedLlm, LlmProvider
+from response_cache import OpenAiEmbedder, ResponseCache, cached_tokens
 
 load_dotenv()
 
@@ -23,92 +33,228 @@ GROQ_API_KEY = os.getenv('GROQ_API_KEY')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
 VOICE_ID = 'ksaI0TCD9BstzEzlxj4q'
+TTS_MODEL_ID = 'eleven_multilingual_v2'
+KEEPALIVE_EXPIRY = 120          # keep idle OpenAI connections around between turns (httpx default is 5s)
+LLM_MODEL = 'gpt-4o-mini'
+FALLBACK_MODEL = 'llama-3.3-70b-versatile'
+LLM_OPTIONS = {"temperature": 0.7, "max_completion_tokens": 1024}
+OPENAI_OPTIONS = {**LLM_OPTIONS, "stream_options": {"include_usage": True}}     # reports cached prompt tokens
+
+TTS_INIT_MESSAGE = {
+    "text": " ",
+    "voice_settings": {"stability": 0.5, "similarity_boost": 0.75, "speed" : 1.0},
+    "generation_config": {
+                            "chunk_length_schedule": [50, 100, 150, 200]  # 더 작은 값들
+                        },
+    "xi_api_key": ELEVENLABS_API_KEY,
+}
+
+aclient = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(keepalive_expiry=KEEPALIVE_EXPIRY)),
+)
+# Groq is the hedge/fallback for slow or failing OpenAI first tokens
+groq_client = AsyncGroq(
+    api_key=GROQ_API_KEY,
+    http_client=groq.DefaultAsyncHttpxClient(limits=httpx.Limits(keepalive_expiry=KEEPALIVE_EXPIRY)),
+) if GROQ_API_KEY else None
+llm = HedgedLlm(
+    LlmProvider("openai", aclient, LLM_MODEL, **OPENAI_OPTIONS),
+    LlmProvider("groq", groq_client, FALLBACK_MODEL, **LLM_OPTIONS) if groq_client is not None else None,
+)
+conversation_manager = None     # created by start_runtime(); server sessions bring their own
+response_cache = None           # set by configure_response_cache(); shared by every manager
+
+SYSTEM_PROMPT = """
+당신은 자연스럽고 친근한 한국어 대화 AI입니다.
 
-aclient = AsyncOpenAI(api_key=OPENAI_API_KEY)
-# aclient = AsyncGroq(api_key=GROQ_API_KEY)
-conversation_manager = ConversationManager()
-
-def is_installed(lib_name):
-    return shutil.which(lib_name) is not None
-
-async def text_chunker(chunks):
-    splitters = (".", ",", "?", "!", ";", ":", "—", "-", "(", ")", "[", "]", "}", " ")
-    buffer = ""
-
-    async for text in chunks:
-        if buffer.endswith(splitters):
-            print(buffer + " ", end="", flush=True)
-            yield buffer + " "
-            buffer = text
-        elif text.startswith(splitters):
-            print(buffer + text[0] + " ", end="", flush=True)
-            yield buffer + text[0] + " "
-            buffer = text[1:]
-        else:
-            buffer += text
+응답 스타일:
+- 항상 한국어로만 답변하세요
+- 간결하고 명확한 문장을 사용하세요
+- 2-3문장으로 핵심만 전달하세요
+- 자연스러운 구어체를 사용하되 정중함을 유지하세요
+- 불필요한 설명이나 장황한 답변은 피하세요
+
+성격 특성:
+- 친근하고 도움이 되는 태도
+- 실용적이고 현실적인 조언 제공  
+- 사용자의 질문에 직접적으로 답변
+- 적당한 활기와 에너지 표현
+
+대화 규칙:
+- 사용자가 한국어가 아닌 언어로 질문해도 한국어로 응답
+- 복잡한 주제도 쉽게 설명
+- 궁금한 점이 있으면 간단히 되묻기
+- 인사나 감사 표현은 자연스럽게 포함
 
-    if buffer:
-        print(buffer + " ", end="", flush=True)
-        yield buffer + " "
+엄격한 언어 제한:
+- 중국어, 영어, 일본어 등 다른 언어 절대 사용 금지
+- 외래어도 가능한 한 한국어로 순화해서 표현
+- 한자어는 사용 가능하지만 중국어 발음이나 표현은 금지
+- 순수 한국어 표현을 최우선으로 사용
+
+금지사항:
+- 과도하게 긴 답변
+- 중국어나 영어, 기타 외국어 혼용
+- 지나치게 격식적인 표현
+- 불필요한 부연설명
+"""
+SYSTEM_PROMPT_TOKENS = count_message_tokens(SYSTEM_PROMPT)
+
+CLEAR_HISTORY_COMMANDS = ('기록삭제', '대화삭제', '히스토리삭제')
+
+runtime = AsyncRuntime()
+tts_pool = WarmSocketPool(VOICE_ID, TTS_MODEL_ID, TTS_INIT_MESSAGE)
+player = None
+speculator = None
+duplex = None
+
+async def text_chunker(chunks, echo=True):
+    async for text in TextSegmenter().segment(chunks):
+        if echo:
+            print(text, end="", flush=True)
+        yield text
 
 async def stream(audio_stream):
-    if not is_installed("mpv"):
-        raise ValueError("mpv not found")
-
-    mpv_process = subprocess.Popen(
-        ["mpv", "--no-cache", "--no-terminal", "--", "fd://0"],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-    )
+    player.begin_utterance()
     first = True
     async for chunk in audio_stream:
         if first:
             print(f"\n{now()} [Audio Start] Started streaming audio")
             first=False
         if chunk:
-            mpv_process.stdin.write(chunk)
-            mpv_process.stdin.flush()
-
-    if mpv_process.stdin:
-        mpv_process.stdin.close()
-    mpv_process.wait()
-
-async def text_to_speech_input_streaming(voice_id, text_iterator):
-    uri = f"wss://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream-input?model_id=eleven_multilingual_v2"
-
-    async with websockets.connect(uri) as websocket:
-        await websocket.send(json.dumps({
-            "text": " ",
-            "voice_settings": {"stability": 0.5, "similarity_boost": 0.75, "speed" : 1.0},
-            "generation_config": {
-                                    "chunk_length_schedule": [50, 100, 150, 200]  # 더 작은 값들
-                                },
-            "xi_api_key": ELEVENLABS_API_KEY,
-        }))
+            # waits while the player's buffer is full, so a slow sink never blocks the loop
+            await player.feed_async(chunk)
+
+    player.end_utterance()
+    await asyncio.get_running_loop().run_in_executor(None, player.wait_done)
+    if not first:
+        tracer.mark("playback_start", at=player.utterance_started_at)
+        tracer.mark("playback_end")
 
+async def text_to_speech_input_streaming(voice_id, text_iterator, tracker=None, pool=None, audio_out=None,
+                                         echo=True):
+    """Send text_iterator to a stream-input socket from pool and hand the audio to audio_out (default: the player)."""
+    websocket = await (pool or tts_pool).acquire(voice_id)
+    listen_task = None
+
+    try:
         async def listen():
             while True:
                 try:
                     message = await websocket.recv()
                     data = json.loads(message)
                     if data.get("audio"):
-                        yield base64.b64decode(data["audio"])
+                        audio = base64.b64decode(data["audio"])
+                        tracer.mark("tts_first_audio")
+                        if tracker is not None:
+                            tracker.add_audio(len(audio), data.get("alignment"))
+                        yield audio
                     elif data.get('isFinal'):
                         break
                 except websockets.exceptions.ConnectionClosed:
                     print("Connection closed")
                     break
 
-        listen_task = asyncio.create_task(stream(listen()))
+        listen_task = asyncio.create_task((audio_out or stream)(listen()))
 
-        async for text in text_chunker(text_iterator):
-            await websocket.send(json.dumps({"text": text, "try_trigger_generation": True}))
+        first = True
+        async for text in text_chunker(text_iterator, echo):
+            if tracker is not None:
+                tracker.add_text(text)
+            # the first chunk is shorter than chunk_length_schedule[0], so ask for generation right away
+            if first:
+                tracer.mark("tts_first_chunk")
+            await websocket.send(json.dumps({"text": text, "flush": True} if first else {"text": text, "try_trigger_generation": True}))
+            first = False
 
         await websocket.send(json.dumps({"text": ""}))
         await listen_task
+    finally:
+        if listen_task is not None and not listen_task.done():
+            listen_task.cancel()
+        await websocket.close()
+
+def build_messages(query, manager=None):
+    manager = manager or conversation_manager
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    messages.extend(manager.get_messages_for_api(
+        reserved_tokens=SYSTEM_PROMPT_TOKENS + count_message_tokens(query)))
+    messages.append({"role": "user", "content": query})
+    return messages
+
+def configure_llm(hedge_ms=None, stall_ms=None, fallback=True):
+    if hedge_ms is not None:
+        llm.hedge_ms = hedge_ms
+    if stall_ms is not None:
+        llm.stall_ms = stall_ms
+    if not fallback:
+        llm.secondary = None
+
+def configure_response_cache(ttl_s=3600, max_entries=500, semantic=False, similarity=0.92):
+    global response_cache
+    embedder = OpenAiEmbedder(aclient) if semantic else None
+    response_cache = ResponseCache(max_entries, ttl_s, embedder=embedder, similarity=similarity)
+
+async def start_llm_stream(query, manager=None, client=None):
+    tracer.mark("llm_request")
+    manager = manager or conversation_manager
+    cache_state = None
+    if response_cache is not None:
+        cached, cache_state = response_cache.lookup_exact(query, manager.conversation_history)
+        if cached is not None:
+            return _replay(cached)
+
+    source = llm
+    if client is not None:
+        source = HedgedLlm(LlmProvider("custom", client, LLM_MODEL, **OPENAI_OPTIONS),
+                           hedge_ms=llm.hedge_ms, stall_ms=llm.stall_ms, first_token_ms=llm.first_token_ms)
+    stream = source.stream(build_messages(query, manager))
+
+    if response_cache is not None and response_cache.embedder is not None:
+        # the request is already in flight, so a miss costs no extra round trip; a hit cancels it
+        try:
+            cached, cache_state = await response_cache.lookup_similar(query, cache_state)
+        except asyncio.CancelledError:
+            await stream.aclose()
+            raise
+        if cached is not None:
+            await stream.aclose()
+            return _replay(cached)
+
+    async def tokens():
+        content = ""
+        async for token in stream:
+            tracer.mark("llm_first_token")
+            content += token
+            yield token
+        if stream.winner is not None:
+            tracer.mark("llm_done", provider=stream.winner.name, stalled=stream.stalled, **stream.usage)
+        # only complete answers are reused; an interrupted turn never gets here
+        if cache_state is not None and not stream.stalled:
+            await response_cache.store(query, content, cache_state)
+
+    return tokens()
+
+async def _replay(cached):
+    async for token in cached_tokens(cached.text):
+        tracer.mark("llm_first_token")
+        yield token
+    tracer.mark("llm_done", provider="cache", stalled=False)
+
+async def chat_completion(query, turn=None):
+    tracer.activate(turn)
+    outcome = "error"
+    try:
+        await _chat_completion(query)
+        outcome = "ok"
+    except asyncio.CancelledError:
+        outcome = "interrupted"
+        raise
+    finally:
+        tracer.end_turn(turn, outcome=outcome)
 
-async def chat_completion(query):
+async def _chat_completion(query):
 
     # system_prompt = """
     #                     You are a 20-year-old Korean man with ESTP personality. Be direct, energetic, and practical in your responses.
@@ -138,77 +284,126 @@ async def chat_completion(query):
     #     stream=True
     # )
 
-    system_prompt = """
-당신은 자연스럽고 친근한 한국어 대화 AI입니다.
+    speculation = await speculator.take(query) if speculator is not None else None
 
-응답 스타일:
-- 항상 한국어로만 답변하세요
-- 간결하고 명확한 문장을 사용하세요
-- 2-3문장으로 핵심만 전달하세요
-- 자연스러운 구어체를 사용하되 정중함을 유지하세요
-- 불필요한 설명이나 장황한 답변은 피하세요
+    def played_ms():
+        return player.interrupted_ms if player.interrupted_ms is not None else player.played_ms
 
-성격 특성:
-- 친근하고 도움이 되는 태도
-- 실용적이고 현실적인 조언 제공  
-- 사용자의 질문에 직접적으로 답변
-- 적당한 활기와 에너지 표현
+    await respond(query, conversation_manager,
+                  lambda text, tracker: text_to_speech_input_streaming(VOICE_ID, text, tracker),
+                  SpokenTextTracker(player.bytes_per_second / 1000), played_ms, speculation)
 
-대화 규칙:
-- 사용자가 한국어가 아닌 언어로 질문해도 한국어로 응답
-- 복잡한 주제도 쉽게 설명
-- 궁금한 점이 있으면 간단히 되묻기
-- 인사나 감사 표현은 자연스럽게 포함
+async def respond(query, manager, speak, tracker, played_ms, speculation=None, client=None):
+    """One assistant turn: LLM tokens into speak(text_iterator, tracker), both sides recorded in manager.
 
-엄격한 언어 제한:
-- 중국어, 영어, 일본어 등 다른 언어 절대 사용 금지
-- 외래어도 가능한 한 한국어로 순화해서 표현
-- 한자어는 사용 가능하지만 중국어 발음이나 표현은 금지
-- 순수 한국어 표현을 최우선으로 사용
-
-금지사항:
-- 과도하게 긴 답변
-- 중국어나 영어, 기타 외국어 혼용
-- 지나치게 격식적인 표현
-- 불필요한 부연설명
-"""
-    conversation_manager.add_message("user", query)
-
-    messages = [{"role": "system", "content": system_prompt}]
-    messages.extend(conversation_manager.get_messages_for_api())
+    On cancellation (barge-in) only the part the user heard, per played_ms(), is kept.
+    """
+    if speculation is not None:
+        tokens = speculation.stream()
+    else:
+        tokens = await start_llm_stream(query, manager, client)
 
-    response = await aclient.chat.completions.create(
-        # model='llama-3.3-70b-versatile',
-        model='gpt-4o-mini',
-        messages=messages,
-        temperature=0.7,
-        max_completion_tokens=1024,
-        stream=True
-    )
+    manager.add_message("user", query)
 
     response_content = ""
 
     async def text_iterator():
         nonlocal response_content
-        async for chunk in response:
-            delta = chunk.choices[0].delta
-            if delta.content:
-                response_content += delta.content
-                yield delta.content
+        async for token in tokens:
+            response_content += token
+            yield token
 
-    await text_to_speech_input_streaming(VOICE_ID, text_iterator())
+    try:
+        await speak(text_iterator(), tracker)
+    except asyncio.CancelledError:
+        # barge-in: keep only what the user actually heard
+        spoken = tracker.spoken_text(played_ms())
+        if spoken:
+            manager.add_message("assistant", spoken)
+        raise
 
     if response_content.strip():
-        conversation_manager.add_message("assistant", response_content.strip())
+        manager.add_message("assistant", response_content.strip())
+
+async def _warm_up():
+    tts_pool.prewarm()
+    try:
+        await aclient.models.retrieve(LLM_MODEL)
+    except Exception as e:
+        print(f"OpenAI 연결 예열 실패: {e}")
+    if llm.secondary is not None:
+        try:
+            await groq_client.models.retrieve(FALLBACK_MODEL)
+        except Exception as e:
+            print(f"Groq 연결 예열 실패: {e}")
+
+def start_runtime(audio_sink="mpv", speculative_ms=None, full_duplex=False, output_format=DEFAULT_OUTPUT_FORMAT,
+                  preroll_ms=0, max_buffer_ms=8000):
+    global conversation_manager, player, speculator, duplex
+    if conversation_manager is None:
+        conversation_manager = ConversationManager()
+    if player is None:
+        # pcm_* formats skip the MP3 decode: frames go straight to the device or WAV file
+        tts_pool.output_format = output_format
+        player = AudioPlayer(create_sink(audio_sink, output_format), bytes_per_second(output_format),
+                             preroll_ms, max_buffer_ms).start()
+    if full_duplex and duplex is None:
+        duplex = DuplexController(runtime, player, chat_completion)
+    if speculative_ms is not None and speculator is None:
+        speculator = Speculator(runtime, start_llm_stream, speculative_ms)
+    if not runtime.running:
+        runtime.start()
+        runtime.submit(_warm_up())
+
+async def _close_connections():
+    await tts_pool.close()
+    await aclient.close()
+    if groq_client is not None:
+        await groq_client.close()
+
+def stop_runtime():
+    if runtime.running:
+        try:
+            runtime.run(_close_connections(), timeout=5)
+        except Exception:
+            pass
+        runtime.stop()
+    if player is not None:
+        player.stop()
+        if player.stats["underruns"] or player.stats["overruns"]:
+            print(player.report())
+    if speculator is not None:
+        print(speculator.report())
+    if duplex is not None:
+        print(f"[Barge-in] {duplex.barge_ins}회")
+    if llm.stats["wins"]:
+        print(llm.report())
+    if response_cache is not None:
+        print(response_cache.report())
+
+def on_interim(transcript):
+    if duplex is not None:
+        duplex.on_user_speech(transcript)
+    if speculator is not None:
+        speculator.on_interim(transcript)
 
 def process_query(query, verbose=False):
     try:
-        if query.strip().lower() in ['기록삭제', '대화삭제', '히스토리삭제']:
+        start_runtime()
+        if query.strip().lower() in CLEAR_HISTORY_COMMANDS:
+            if duplex is not None:
+                duplex.barge_in()
+            if speculator is not None:
+                speculator.discard()
             conversation_manager.clear_history()
             print("대화 기록을 삭제했습니다.")
             return
-        
-        asyncio.run(chat_completion(query))
+
+        turn = tracer.current
+        if duplex is not None:
+            duplex.submit(query, turn)
+        else:
+            runtime.run(chat_completion(query, turn))
     except Exception as e:
         if verbose:
             print(f"쿼리 처리 실패: {e}")
@@ -0,0 +1,91 @@
+import bisect
+from collections import deque
+
+import webrtcvad
+
+FRAME_MS = 30               # webrtcvad accepts 10, 20 or 30 ms frames
+
+
+class VadGate:
+    """Forwards only speech frames, plus pre-/post-roll padding, to the recognizer.
+
+    Google's result_end_time is measured on the audio it actually received,
+    so every jump in the forwarded stream is recorded and to_captured_ms()
+    maps a recognizer timestamp back onto the captured (session) timeline.
+    A single frame is let through every keepalive_ms of silence so the
+    stream is not closed for lack of audio.
+    """
+
+    def __init__(self, sample_rate, aggressiveness=2, pre_roll_ms=300, post_roll_ms=600, keepalive_ms=4000):
+        self._vad = webrtcvad.Vad(aggressiveness)
+        self.sample_rate = sample_rate
+        self.frame_bytes = sample_rate * 2 * FRAME_MS // 1000
+        self.pre_roll_frames = pre_roll_ms // FRAME_MS
+        self.post_roll_frames = post_roll_ms // FRAME_MS
+        self.keepalive_frames = keepalive_ms // FRAME_MS
+        self.total_captured_ms = 0
+        self.forwarded_ms = 0
+        self.reset()
+
+    def reset(self):
+        self._remainder = b""
+        self._pre_roll = deque(maxlen=self.pre_roll_frames)
+        self._hangover = 0
+        self._since_forward = 0
+        self.captured_ms = 0
+        self.sent_ms = 0
+        self._forward_end = 0
+        self._map_captured = [0]
+        self._map_sent = [0]
+
+    def is_speech(self, frame):
+        return self._vad.is_speech(frame, self.sample_rate)
+
+    def _forward(self, out, frame, captured_ms):
+        if captured_ms != self._forward_end:
+            self._map_captured.append(captured_ms)
+            self._map_sent.append(self.sent_ms)
+        out.append(frame)
+        self.sent_ms += FRAME_MS
+        self.forwarded_ms += FRAME_MS
+        self._forward_end = captured_ms + FRAME_MS
+        self._since_forward = 0
+
+    def process(self, data) -> bytes:
+        if self._remainder:
+            data = self._remainder + data
+        usable = len(data) - len(data) % self.frame_bytes
+        self._remainder = data[usable:]
+
+        out = []
+        for offset in range(0, usable, self.frame_bytes):
+            frame = data[offset:offset + self.frame_bytes]
+            captured_ms = self.captured_ms
+            self.captured_ms += FRAME_MS
+            self.total_captured_ms += FRAME_MS
+
+            if self.is_speech(frame):
+                while self._pre_roll:
+                    pre_frame, pre_ms = self._pre_roll.popleft()
+                    self._forward(out, pre_frame, pre_ms)
+                self._forward(out, frame, captured_ms)
+                self._hangover = self.post_roll_frames
+            elif self._hangover > 0:
+                self._hangover -= 1
+                self._forward(out, frame, captured_ms)
+            elif self._since_forward >= self.keepalive_frames:
+                self._pre_roll.clear()
+                self._forward(out, frame, captured_ms)
+            else:
+                self._pre_roll.append((frame, captured_ms))
+                self._since_forward += 1
+
+        return b"".join(out)
+
+    @property
+    def dropped_ms(self):
+        return self.total_captured_ms - self.forwarded_ms
+
+    def to_captured_ms(self, sent_ms):
+        i = bisect.bisect_right(self._map_sent, sent_ms) - 1
+        return self._map_captured[i] + (sent_ms - self._map_sent[i])
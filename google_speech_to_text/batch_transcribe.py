@@ -0,0 +1,317 @@
+"""Transcribe recorded WAV/FLAC files with many concurrent streaming_recognize sessions.
+
+    python batch_transcribe.py recordings/ transcripts/ --concurrency 32
+    python batch_transcribe.py files.txt transcripts/ --language ko-KR
+
+The input is a directory (searched recursively for .wav/.flac) or a manifest
+with one path per line. Streaming recognition rejects audio that arrives much
+faster than real time, so each session is paced at --speed (at most MAX_SPEED)
+times real time and throughput comes from running --concurrency sessions at
+once. Files longer than STREAMING_LIMIT are cut into segments at the quietest
+point near each boundary and every segment gets its own session.
+
+For each input <name>.wav the output directory receives <name>.json (segments
+with start/end seconds, text and confidence) and <name>.txt ("[hh:mm:ss.mmm]
+text" lines). Multi-channel recordings (e.g. both sides of a call) are
+recognized per channel and every segment carries its channel number. Files
+whose .json already exists are skipped.
+
+FLAC needs the optional soundfile package. SPEECH_EMULATOR_HOST points the
+client at a local emulator, as in full_pipeline.
+"""
+import argparse
+import array
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+import wave
+
+from dotenv import load_dotenv
+from google.cloud import speech
+
+try:
+    import soundfile
+except ImportError:        # only needed for FLAC
+    soundfile = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "full_pipeline"))
+from stt_google_cloud import MAX_REQUEST_BYTES, STREAMING_LIMIT, create_async_speech_client
+
+load_dotenv()
+
+SPLIT_SEARCH_MS = 5000          # look this far back from a segment boundary for silence
+CHUNK_MS = 100                  # audio per request, as a microphone would send it
+MAX_SPEED = 2.0                 # faster pacing fails with "Audio data is being streamed too fast"
+STREAMS_PER_CHANNEL = 100       # concurrent HTTP/2 streams one gRPC connection carries
+AUDIO_EXTENSIONS = (".wav", ".flac")
+
+
+class Audio:
+    def __init__(self, pcm, sample_rate, channels):
+        self.pcm = pcm                  # 16-bit little-endian interleaved
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+    @property
+    def frame_bytes(self):
+        return 2 * self.channels
+
+    @property
+    def duration_ms(self):
+        return len(self.pcm) // self.frame_bytes * 1000 // self.sample_rate
+
+
+def read_audio(path):
+    if path.lower().endswith(".flac"):
+        if soundfile is None:
+            raise RuntimeError("FLAC input needs the soundfile package (pip install soundfile)")
+        data, sample_rate = soundfile.read(path, dtype="int16", always_2d=True)
+        return Audio(data.tobytes(), sample_rate, data.shape[1])
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2 or f.getcomptype() != "NONE":
+            raise RuntimeError("only 16-bit PCM WAV is supported")
+        return Audio(f.readframes(f.getnframes()), f.getframerate(), f.getnchannels())
+
+
+def split_points(audio, limit_ms=STREAMING_LIMIT, search_ms=SPLIT_SEARCH_MS, frame_ms=20):
+    """Byte offsets of segment starts; each cut is at the lowest-energy frame before the limit."""
+    bytes_per_ms = audio.sample_rate * audio.frame_bytes / 1000
+    frame = int(frame_ms * bytes_per_ms) // audio.frame_bytes * audio.frame_bytes
+    limit = int(limit_ms * bytes_per_ms) // audio.frame_bytes * audio.frame_bytes
+    search = int(search_ms * bytes_per_ms) // frame * frame
+    points = [0]
+    while len(audio.pcm) - points[-1] > limit:
+        end = points[-1] + limit
+        best, best_energy = end, None
+        for offset in range(end - search, end, frame):
+            samples = array.array("h", audio.pcm[offset:offset + frame])
+            if sys.byteorder == "big":
+                samples.byteswap()
+            energy = sum(s * s for s in samples[::4])
+            if best_energy is None or energy < best_energy:
+                best, best_energy = offset, energy
+        points.append(best)
+    return points
+
+
+def find_inputs(source):
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(AUDIO_EXTENSIONS))
+        return sorted(paths), source
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    paths = list(dict.fromkeys(os.path.normpath(os.path.join(base, path)) for path in lines))
+    # outputs mirror the layout below the manifest's common directory, so a/call.wav and b/call.wav stay apart
+    root = os.path.commonpath([os.path.dirname(path) for path in paths]) if paths else base
+    return paths, root
+
+
+def output_stem(path, out_dir, root):
+    return os.path.join(out_dir, os.path.splitext(os.path.relpath(path, root))[0])
+
+
+def format_time(seconds):
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{seconds:06.3f}"
+
+
+class SpeechChannels:
+    """One SpeechAsyncClient per gRPC channel; sessions are spread over them round-robin."""
+
+    def __init__(self, concurrency):
+        count = max(1, math.ceil(concurrency / STREAMS_PER_CHANNEL))
+        self.clients = [create_async_speech_client() for _ in range(count)]
+        self._next = 0
+
+    def next(self):
+        client = self.clients[self._next % len(self.clients)]
+        self._next += 1
+        return client
+
+    async def close(self):
+        for client in self.clients:
+            await client.transport.close()
+
+
+class BatchTranscriber:
+    def __init__(self, language="ko-KR", concurrency=16, retries=2, segment_ms=STREAMING_LIMIT, speed=1.0):
+        self.language = language
+        self.speed = speed
+        self.retries = retries
+        self.segment_ms = segment_ms
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.channels = SpeechChannels(concurrency)
+
+    def streaming_config(self, audio):
+        return speech.StreamingRecognitionConfig(
+            config=speech.RecognitionConfig(
+                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+                sample_rate_hertz=audio.sample_rate,
+                audio_channel_count=audio.channels,
+                enable_separate_recognition_per_channel=audio.channels > 1,
+                language_code=self.language,
+                max_alternatives=1,
+                enable_automatic_punctuation=True,
+                enable_word_time_offsets=True,
+            ),
+            interim_results=False,
+            single_utterance=False,
+        )
+
+    async def _requests(self, audio, pcm):
+        yield speech.StreamingRecognizeRequest(streaming_config=self.streaming_config(audio))
+        bytes_per_s = audio.sample_rate * audio.frame_bytes
+        chunk = min(bytes_per_s * CHUNK_MS // 1000 // audio.frame_bytes * audio.frame_bytes, MAX_REQUEST_BYTES)
+        deadline = time.monotonic()
+        for i in range(0, len(pcm), chunk):
+            yield speech.StreamingRecognizeRequest(audio_content=pcm[i:i + chunk])
+            if self.speed:
+                deadline += chunk / bytes_per_s / self.speed
+                await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+
+    async def _recognize_segment(self, audio, pcm, offset_s):
+        segments = []
+        previous_end = {}
+        responses = await self.channels.next().streaming_recognize(
+            requests=self._requests(audio, pcm))
+        async for response in responses:
+            for result in response.results:
+                if not result.is_final or not result.alternatives:
+                    continue
+                best = result.alternatives[0]
+                end = result.result_end_time.total_seconds()
+                channel = result.channel_tag or 1
+                start = best.words[0].start_time.total_seconds() if best.words else previous_end.get(channel, 0.0)
+                previous_end[channel] = end
+                if best.transcript.strip():
+                    segment = {"start": round(offset_s + start, 3), "end": round(offset_s + end, 3),
+                               "text": best.transcript.strip(), "confidence": round(best.confidence, 3)}
+                    if audio.channels > 1:
+                        segment["channel"] = channel
+                    segments.append(segment)
+        return segments
+
+    async def _segment(self, audio, pcm, offset_s):
+        async with self.semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    return await self._recognize_segment(audio, pcm, offset_s)
+                except Exception as e:
+                    if attempt == self.retries:
+                        raise
+                    print(f"  재시도 ({offset_s:.0f}s 구간): {e}")
+                    await asyncio.sleep(2 ** attempt)
+
+    async def transcribe(self, path):
+        """(segments, audio seconds) for one file; its pieces run concurrently under the shared limit."""
+        audio = await asyncio.get_running_loop().run_in_executor(None, read_audio, path)
+        points = split_points(audio, self.segment_ms)
+        bytes_per_s = audio.sample_rate * audio.frame_bytes
+        pieces = [(audio.pcm[start:end], start / bytes_per_s)
+                  for start, end in zip(points, points[1:] + [len(audio.pcm)])]
+        results = await asyncio.gather(*(self._segment(audio, pcm, offset) for pcm, offset in pieces))
+        segments = sorted((segment for result in results for segment in result), key=lambda s: s["start"])
+        return segments, audio.duration_ms / 1000
+
+    async def close(self):
+        await self.channels.close()
+
+
+def write_transcript(stem, path, segments, duration_s):
+    os.makedirs(os.path.dirname(stem) or ".", exist_ok=True)
+    with open(stem + ".txt", "w", encoding="utf-8") as f:
+        for segment in segments:
+            speaker = f"[ch{segment['channel']}] " if "channel" in segment else ""
+            f.write(f"[{format_time(segment['start'])}] {speaker}{segment['text']}\n")
+    # the .json marks the file as done, so it is written last
+    with open(stem + ".json.part", "w", encoding="utf-8") as f:
+        json.dump({"file": path, "duration": round(duration_s, 3), "segments": segments}, f,
+                  ensure_ascii=False, indent=1)
+    os.replace(stem + ".json.part", stem + ".json")
+
+
+async def run(args):
+    paths, root = find_inputs(args.input)
+    stems = {}
+    for path in paths:
+        stem = output_stem(path, args.out_dir, root)
+        if stem in stems:
+            print(f"Error: {stems[stem]} and {path} would both write {stem}.json")
+            return 1
+        stems[stem] = path
+    todo = [path for path in paths
+            if args.overwrite or not os.path.exists(output_stem(path, args.out_dir, root) + ".json")]
+    print(f"{len(paths)}개 파일 중 {len(paths) - len(todo)}개 완료됨, {len(todo)}개 인식 (동시 {args.concurrency})")
+
+    transcriber = BatchTranscriber(args.language, args.concurrency, speed=args.speed)
+    started = time.monotonic()
+    totals = {"ok": 0, "failed": 0, "audio_s": 0.0}
+
+    async def one(path):
+        try:
+            segments, duration_s = await transcriber.transcribe(path)
+        except Exception as e:
+            totals["failed"] += 1
+            print(f"실패 {path}: {e}")
+            return
+        write_transcript(output_stem(path, args.out_dir, root), path, segments, duration_s)
+        totals["ok"] += 1
+        totals["audio_s"] += duration_s
+        elapsed = time.monotonic() - started
+        print(f"[{totals['ok'] + totals['failed']}/{len(todo)}] {path} ({duration_s:.0f}s, {len(segments)}문장)  "
+              f"{totals['audio_s'] / elapsed:.1f} audio-s/s")
+
+    queue = asyncio.Queue()
+    for path in todo:
+        queue.put_nowait(path)
+
+    async def worker():
+        while not queue.empty():
+            await one(queue.get_nowait())
+
+    try:
+        # as many files in memory as sessions allowed; long files' segments share the same semaphore
+        await asyncio.gather(*(worker() for _ in range(min(args.concurrency, len(todo)))))
+    finally:
+        await transcriber.close()
+
+    elapsed = time.monotonic() - started
+    print(f"done: {totals['ok']} transcribed, {totals['failed']} failed, "
+          f"{totals['audio_s']:.0f}s of audio in {elapsed:.1f}s")
+    if elapsed > 0 and totals["ok"]:
+        print(f"throughput: {totals['audio_s'] / elapsed:.1f} audio-s/s, {totals['ok'] / elapsed:.2f} files/s")
+    return 1 if totals["failed"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Directory of .wav/.flac files or a manifest with one path per line")
+    parser.add_argument("out_dir")
+    parser.add_argument("--concurrency", type=int, default=16, help="Recognition sessions open at once")
+    parser.add_argument("--language", default="ko-KR")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help=f"Audio pacing per session, 1 is real time (max {MAX_SPEED:g}; 0 unpaced, emulator only)")
+    parser.add_argument("--overwrite", action="store_true", help="Transcribe files that already have output")
+    args = parser.parse_args()
+    if not 0 <= args.speed <= MAX_SPEED:
+        parser.error(f"--speed must be between 0 and {MAX_SPEED:g}")
+
+    if not os.getenv("GOOGLE_APPLICATION_CREDENTIALS") and not os.getenv("SPEECH_EMULATOR_HOST"):
+        print("Error: GOOGLE_APPLICATION_CREDENTIALS not found in .env file")
+        return 1
+    try:
+        return asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\n중단되었습니다. 다시 실행하면 남은 파일부터 이어서 인식합니다.")
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3 @@
+from tts_cache.cache import TtsCache, cache_key, default_cache, normalize_text
+
+__all__ = ["TtsCache", "cache_key", "default_cache", "normalize_text"]
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+import uuid
+from collections import OrderedDict
+
+CHUNK_SIZE = 16384
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    # the same sentence typed twice should not be synthesized twice
+    return _SPACES.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(engine, voice, model, output_format, settings, text):
+    """sha256 over everything that changes the audio; settings must be JSON-serializable."""
+    payload = json.dumps([engine, voice, model, output_format, settings or {}, normalize_text(text)],
+                         sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TtsCache:
+    """Two-tier content-addressed cache for synthesized audio.
+
+    Entries live on disk as <directory>/<key[:2]>/<key>, bounded by
+    disk_bytes and evicted least recently used first (file mtimes carry the
+    order across restarts). Entries up to memory_item_bytes are also kept in
+    a memory LRU of memory_bytes. Hits are served as chunk iterators, so
+    callers stream from memory or disk the same way they stream from the API.
+    """
+
+    def __init__(self, directory, memory_bytes=32 * 1024 * 1024, disk_bytes=512 * 1024 * 1024,
+                 memory_item_bytes=1024 * 1024):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory_item_bytes = memory_item_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()    # key -> bytes
+        self._memory_size = 0
+        self._disk = OrderedDict()      # key -> size, least recently used first
+        self._disk_size = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0,
+                      "bytes_served": 0, "bytes_stored": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _scan(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith(".tmp"):
+                    os.remove(path)     # left behind by an interrupted write
+                    continue
+                st = os.stat(path)
+                entries.append((st.st_mtime, name, st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
+        with self._lock:
+            self._evict_disk()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._memory or key in self._disk
+
+    @property
+    def memory_size(self):
+        return self._memory_size
+
+    @property
+    def disk_size(self):
+        return self._disk_size
+
+    def get(self, key):
+        """The whole entry as bytes, or None."""
+        chunks = self.stream(key)
+        return None if chunks is None else b"".join(chunks)
+
+    def stream(self, key, chunk_size=CHUNK_SIZE):
+        """A chunk iterator over the cached audio, or None on a miss."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._touch_disk(key)
+                self.stats["memory_hits"] += 1
+                self.stats["bytes_served"] += len(data)
+                return (data[i:i + chunk_size] for i in range(0, len(data), chunk_size))
+            if key not in self._disk:
+                self.stats["misses"] += 1
+                return None
+            self._touch_disk(key)
+            self.stats["disk_hits"] += 1
+            size = self._disk[key]
+        try:
+            f = open(self._path(key), "rb")
+        except FileNotFoundError:
+            with self._lock:
+                self._drop_disk(key)
+                self.stats["disk_hits"] -= 1
+                self.stats["misses"] += 1
+            return None
+        return self._read_file(key, f, size, chunk_size)
+
+    def _read_file(self, key, f, size, chunk_size):
+        promote = [] if size <= self.memory_item_bytes else None
+        with f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                with self._lock:
+                    self.stats["bytes_served"] += len(chunk)
+                if promote is not None:
+                    promote.append(chunk)
+                yield chunk
+        if promote is not None:
+            self._remember(key, b"".join(promote))
+
+    def put(self, key, data):
+        for _ in self.record(key, [data]):
+            pass
+
+    def store_file(self, key, path):
+        """Copy an existing audio file into the cache without loading more than one chunk at a time."""
+        with open(path, "rb") as f:
+            for _ in self.record(key, iter(lambda: f.read(CHUNK_SIZE), b"")):
+                pass
+
+    def record(self, key, chunks):
+        """Pass chunks through while writing them to the cache; stored only if the iterator completes."""
+        tmp = f"{self._path(key)}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(os.path.dirname(tmp), exist_ok=True)
+        parts = []
+        size = 0
+        complete = False
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    if chunk:
+                        f.write(chunk)
+                        size += len(chunk)
+                        if size <= self.memory_item_bytes:
+                            parts.append(chunk)
+                    yield chunk
+            complete = size > 0
+        finally:
+            if complete:
+                self._install(key, tmp, size, b"".join(parts) if size <= self.memory_item_bytes else None)
+            else:
+                os.remove(tmp)
+
+    def _install(self, key, tmp, size, data):
+        os.replace(tmp, self._path(key))
+        with self._lock:
+            self._drop_disk(key)
+            self._disk[key] = size
+            self._disk_size += size
+            self.stats["stores"] += 1
+            self.stats["bytes_stored"] += size
+            self._evict_disk()
+        if data is not None:
+            self._remember(key, data)
+
+    def _remember(self, key, data):
+        with self._lock:
+            if key in self._memory:
+                self._memory_size -= len(self._memory.pop(key))
+            self._memory[key] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.memory_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    def _touch_disk(self, key):
+        if key in self._disk:
+            self._disk.move_to_end(key)
+            try:
+                os.utime(self._path(key))
+            except OSError:
+                pass
+
+    def _drop_disk(self, key):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_size -= size
+
+    def _evict_disk(self):
+        while self._disk_size > self.disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            self.stats["evictions"] += 1
+            if key in self._memory:
+                self._memory_size -= len(self._memory.pop(key))
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._disk):
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+            self._disk.clear()
+            self._memory.clear()
+            self._disk_size = self._memory_size = 0
+
+    def report(self):
+        s = self.stats
+        hits = s["memory_hits"] + s["disk_hits"]
+        lookups = hits + s["misses"]
+        rate = hits / lookups * 100 if lookups else 0.0
+        return (f"[TTS cache] hits {hits} (memory {s['memory_hits']}, disk {s['disk_hits']}), misses {s['misses']} "
+                f"(hit rate {rate:.0f}%), served {s['bytes_served']} bytes, stored {s['bytes_stored']} bytes, "
+                f"evictions {s['evictions']}, disk {self._disk_size}/{self.disk_bytes} bytes")
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    """Process-wide cache configured from TTS_CACHE_DIR / TTS_CACHE_MAX_MB; None if TTS_CACHE_DIR=off."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            directory = os.getenv("TTS_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "tts_cache")
+            if directory.lower() == "off":
+                return None
+            _default = TtsCache(directory, disk_bytes=int(os.getenv("TTS_CACHE_MAX_MB", "512")) * 1024 * 1024)
+        return _default